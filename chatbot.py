@@ -5,25 +5,129 @@ import threading
 import random
 import json
 import os
-from datetime import datetime
+import re
+import math
+import sqlite3
+from datetime import datetime, timedelta
 import pickle
-from collections import deque
+import struct
+import zlib
+import sys
+import queue
+import heapq
+import itertools
+import asyncio
+import importlib.util
+import mmap
+import tempfile
+import hashlib
+from array import array
+from collections import deque, OrderedDict
+
+STARTUP_BEGIN = time.perf_counter()
 
 # -------------------- Additional Libraries -------------------- #
 # Run these commands in terminal to install required packages:
 # pip install textblob plyer
+# pip install numpy  (optional, for the TF-IDF intent classifier)
+#
+# Availability is detected without importing; TextBlob pulls in NLTK, so the
+# packages themselves are only imported on first use (or by the warm-up).
+
+SENTIMENT_ANALYSIS = importlib.util.find_spec("textblob") is not None
+NOTIFICATIONS = importlib.util.find_spec("plyer") is not None
+VECTOR_MATH = importlib.util.find_spec("numpy") is not None
+
+TextBlob = None
+notification = None
+np = None
+
+def load_textblob():
+    global TextBlob, SENTIMENT_ANALYSIS
+    if TextBlob is None and SENTIMENT_ANALYSIS:
+        try:
+            from textblob import TextBlob as text_blob
+            TextBlob = text_blob
+        except ImportError:
+            SENTIMENT_ANALYSIS = False
+    return TextBlob
+
+SYSTEM_WORD_LISTS = ("/usr/share/dict/words", "/usr/dict/words")
+
+def load_known_words():
+    # Real words the typo corrector must leave alone: TextBlob's spelling
+    # list (read as a plain file so NLTK stays unloaded) and the system
+    # dictionary, whichever are installed
+    paths = list(SYSTEM_WORD_LISTS)
+    if SENTIMENT_ANALYSIS:
+        spec = importlib.util.find_spec("textblob")
+        if spec is not None and spec.submodule_search_locations:
+            paths.append(os.path.join(spec.submodule_search_locations[0], "en", "en-spelling.txt"))
+    
+    words = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                words.extend(line.split()[0] for line in f if line.strip() and not line.startswith(";"))
+        except OSError:
+            pass
+    return words
+
+def load_notifier():
+    global notification, NOTIFICATIONS
+    if notification is None and NOTIFICATIONS:
+        try:
+            from plyer import notification as plyer_notification
+            notification = plyer_notification
+        except ImportError:
+            NOTIFICATIONS = False
+    return notification
+
+def load_numpy():
+    global np, VECTOR_MATH
+    if np is None and VECTOR_MATH:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            VECTOR_MATH = False
+    return np
+
+# -------------------- Startup Timing -------------------- #
+class StartupTimer:
+    PHASES = ["import", "history load", "ui build", "first paint"]
+    
+    def __init__(self, origin):
+        self.origin = origin
+        self.phases = {}
+    
+    def record(self, phase, seconds):
+        # Only the first occurrence counts; later reloads are not startup cost
+        self.phases.setdefault(phase, seconds)
+    
+    def measure(self, phase):
+        timer = self
+        
+        class Measure:
+            def __enter__(self):
+                self.start = time.perf_counter()
+            
+            def __exit__(self, *exc):
+                timer.record(phase, time.perf_counter() - self.start)
+        
+        return Measure()
+    
+    def report(self):
+        lines = ["Startup timing:"]
+        for phase in self.PHASES + [p for p in self.phases if p not in self.PHASES]:
+            seconds = self.phases.get(phase)
+            value = f"{seconds * 1000:8.1f} ms" if seconds is not None else "deferred"
+            lines.append(f"  {phase:<14}{value}")
+        if "first paint" in self.phases:
+            lines.append(f"  {'window ready':<14}{self.phases['first paint'] * 1000:8.1f} ms after launch")
+        return "\n".join(lines)
 
-try:
-    from textblob import TextBlob
-    SENTIMENT_ANALYSIS = True
-except ImportError:
-    SENTIMENT_ANALYSIS = False
-    
-try:
-    from plyer import notification
-    NOTIFICATIONS = True
-except ImportError:
-    NOTIFICATIONS = False
+STARTUP = StartupTimer(STARTUP_BEGIN)
 
 # -------------------- Configuration -------------------- #
 class Config:
@@ -67,99 +171,1637 @@ class Config:
         self.save_history = True
         self.max_memory = 10
         self.auto_save = True
+        self.history_storage = "journal"  # "journal" (append-only), "sqlite" or "json"
+        self.history_retention = 50  # Conversations kept in history
+        self.history_max_age_days = None  # Also drop older conversations (sqlite only)
+        self.search_index = True  # Full-text index over saved messages
+        self.render_window = 200  # Messages kept in the chat widget
+        self.render_page = 50     # Earlier messages loaded per scroll to the top
+        self.session_compression = True  # zlib-compress saved .chat sessions
+        self.session_hot_messages = 2000  # Newest messages kept in memory; older ones spill to disk
+        self.suggestion_count = 4    # Autocomplete entries shown under the input field
+        self.suggestion_delay = 120  # Milliseconds of typing pause before suggestions refresh
+        self.notification_window = 2.0  # Seconds over which notifications merge into one
+        self.notification_rate = 0.2    # Sustained notifications per second
+        self.notification_burst = 2     # Notifications allowed back to back
+        self.session_capacity = 50000   # Live conversations kept by the core before LRU eviction
+        self.session_ttl = 1800         # Seconds a conversation may sit idle before eviction
+        self.session_shards = 16        # Independently locked partitions of the session registry
+        self.session_snapshots = None   # Directory for evicted conversations (None discards them)
+        self.reply_delay = 0.8   # Simulated typing delay in seconds (0 for benchmarks)
+        self.reply_jitter = 0.5  # Extra random delay added on top of reply_delay
+        self.sentiment_cache_size = 1024
+        self.mood_ema_alpha = 0.3  # Weight of the newest message in "current mood"
+        self.intent_classifier = "matcher"  # "matcher" (substring patterns) or "tfidf" (needs NumPy)
+        self.intent_threshold = 0.3  # Minimum TF-IDF cosine similarity before falling back
+        self.typo_max_distance = 2   # Edits allowed when correcting typos before matching (0 disables)
+        self.typo_cache_size = 4096  # Corrections remembered
+        self.background_warmup = True  # Preload NLTK, responses and history after first paint
+        self.startup_report = False    # Print the startup phase timings after first paint
+
+# -------------------- Message Records -------------------- #
+# Compact in-memory records for messages and memory exchanges. Sender and
+# type values are interned and timestamps are floats; the dict/JSON schema
+# is produced only at the edges (to_dict, record_to_json), and the get()/[]
+# accessors keep dict-style readers working unchanged.
+EPOCH = datetime(1970, 1, 1)
+MISSING = object()
+
+def parse_timestamp(value):
+    # Naive ISO strings become float seconds since EPOCH (local wall clock);
+    # anything else is kept as-is so it serializes back unchanged
+    if isinstance(value, str):
+        try:
+            dt = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+        if dt.tzinfo is None:
+            seconds = (dt - EPOCH) / timedelta(seconds=1)
+            if format_timestamp(seconds) == value:
+                return seconds
+    return value
+
+def format_timestamp(value):
+    if isinstance(value, float):
+        return (EPOCH + timedelta(seconds=value)).isoformat()
+    return value
+
+class MessageAnalysis:
+    # Everything the analyzers need from one message, computed once: the
+    # lowercased whitespace-collapsed text, its word tokens, their set and
+    # the word bigrams. Sentiment, intent matching, context checks and the
+    # memory summary all read this instead of rescanning the raw string.
+    __slots__ = ("text", "normalized", "tokens", "token_set", "ngrams", "padded")
+    TOKEN_RE = re.compile(r"[a-z0-9']+")
+    
+    def __init__(self, text):
+        self.text = text
+        self.normalized = " ".join(text.lower().split())
+        self.tokens = tuple(self.TOKEN_RE.findall(self.normalized))
+        self.token_set = frozenset(self.tokens)
+        self.ngrams = tuple(f"{first} {second}" for first, second in zip(self.tokens, self.tokens[1:]))
+        self.padded = f" {' '.join(self.tokens)} "
+    
+    @classmethod
+    def of(cls, text):
+        return text if isinstance(text, cls) else cls(text)
+    
+    def has_phrase(self, phrase):
+        # Whole-word match, so "hi" is not found in "this"
+        return f" {phrase} " in self.padded
+
+class Message:
+    __slots__ = ("sender", "message", "type", "timestamp", "extra", "analysis")
+    FIELDS = ("sender", "message", "type", "timestamp")
+    
+    def __init__(self, sender=None, message=None, msg_type=None, timestamp=None, extra=None):
+        self.sender = sys.intern(sender) if isinstance(sender, str) else sender
+        self.message = message
+        self.type = sys.intern(msg_type) if isinstance(msg_type, str) else msg_type
+        self.timestamp = timestamp
+        self.extra = extra or None
+        self.analysis = None  # MessageAnalysis, attached by send_message; never persisted
+    
+    @classmethod
+    def now(cls, sender, message, msg_type, **extra):
+        return cls(sender, message, msg_type, (datetime.now() - EPOCH) / timedelta(seconds=1), extra)
+    
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, cls):
+            return data
+        extra = {key: value for key, value in data.items() if key not in cls.FIELDS}
+        return cls(data.get("sender"), data.get("message"), data.get("type"),
+                   parse_timestamp(data.get("timestamp")), extra)
+    
+    def to_dict(self):
+        data = {}
+        for key in self.FIELDS:
+            value = self.get(key)
+            if value is not None:
+                data[key] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+    
+    def get(self, key, default=None):
+        if key == "timestamp":
+            value = format_timestamp(self.timestamp)
+        elif key in self.FIELDS:
+            value = getattr(self, key)
+        else:
+            return self.extra.get(key, default) if self.extra else default
+        return default if value is None else value
+    
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+    
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+    
+    def __eq__(self, other):
+        if isinstance(other, (Message, dict)):
+            return self.to_dict() == (other.to_dict() if isinstance(other, Message) else other)
+        return NotImplemented
+    
+    def keys(self):
+        return self.to_dict().keys()
+    
+    def items(self):
+        return self.to_dict().items()
+
+class Exchange:
+    __slots__ = ("user", "bot", "timestamp", "analysis")
+    
+    def __init__(self, user, bot, timestamp=None, analysis=None):
+        self.user = user
+        self.bot = bot
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.analysis = analysis
+    
+    def analyzed(self):
+        # Analysis of the user side; exchanges restored from a session compute it on demand
+        if self.analysis is None:
+            self.analysis = MessageAnalysis(self.user)
+        return self.analysis
+    
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, cls):
+            return data
+        return cls(data.get("user", ""), data.get("bot", ""), data.get("timestamp"))
+    
+    def to_dict(self):
+        return {"user": self.user, "bot": self.bot, "timestamp": self.timestamp, "time": self.get("time")}
+    
+    def get(self, key, default=None):
+        if key == "time":
+            return datetime.fromtimestamp(self.timestamp).strftime("%H:%M:%S") if self.timestamp else default
+        if key in ("user", "bot", "timestamp"):
+            return getattr(self, key)
+        return default
+    
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+def record_to_json(obj):
+    # json.dumps default= hook for Message/Exchange records and session views
+    if isinstance(obj, (Message, Exchange)):
+        return obj.to_dict()
+    if isinstance(obj, SessionSlice):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# -------------------- Persistence Worker -------------------- #
+class PersistenceWorker:
+    # Owns history and session file I/O on a single background thread.
+    # Requests arriving within the coalescing window are merged into one
+    # flush: whole-file writes to the same path keep only the latest data,
+    # appends to the same path are concatenated. Whole-file writes go to a
+    # temp file that is renamed over the target. Completion callbacks are
+    # queued for the UI thread to run via drain_completions().
+    def __init__(self, coalesce_window=0.05):
+        self.coalesce_window = coalesce_window
+        self.requests = queue.Queue()
+        self.completions = queue.Queue()
+        self.stats = {"submitted": 0, "flushes": 0, "writes": 0, "coalesced": 0, "errors": 0}
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def write_file(self, path, data, on_done=None):
+        # data may be a callable; it is then serialized on the worker thread
+        self.submit("replace", path, data, on_done)
+    
+    def append_file(self, path, data, on_done=None):
+        self.submit("append", path, data, on_done)
+    
+    def call(self, func, on_done=None):
+        self.submit("call", None, func, on_done)
+    
+    def submit(self, kind, path, data, on_done):
+        self.stats["submitted"] += 1
+        self.requests.put((kind, path, data, on_done))
+    
+    def run(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                break
+            
+            batch = [item]
+            closing = False
+            deadline = time.monotonic() + self.coalesce_window
+            while True:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            
+            self.flush(batch)
+            if closing:
+                break
+    
+    def flush(self, batch):
+        pending = {}
+        for index, (kind, path, data, on_done) in enumerate(batch):
+            key = ("call", index) if kind == "call" else (kind, path)
+            job = pending.get(key)
+            if job is None:
+                pending[key] = [kind, path, data, [on_done]]
+                continue
+            
+            self.stats["coalesced"] += 1
+            if kind == "append":
+                job[2] = job[2] + data
+            else:
+                job[2] = data
+            job[3].append(on_done)
+        
+        for kind, path, data, callbacks in pending.values():
+            error = None
+            try:
+                if kind == "call":
+                    data()
+                else:
+                    if callable(data):
+                        data = data()
+                    if kind == "replace":
+                        self.atomic_write(path, data)
+                    else:
+                        self.append(path, data)
+                    self.stats["writes"] += 1
+            except Exception as e:
+                error = e
+                self.stats["errors"] += 1
+            
+            for on_done in callbacks:
+                if on_done is not None:
+                    self.completions.put((on_done, error))
+        
+        self.stats["flushes"] += 1
+    
+    def atomic_write(self, path, data):
+        # data may also be an iterable of str or bytes chunks, streamed to disk
+        chunks = iter((data,) if isinstance(data, (str, bytes)) else data)
+        first = next(chunks, "")
+        tmp_path = f"{path}.tmp"
+        if isinstance(first, bytes):
+            f = open(tmp_path, 'wb')
+        else:
+            f = open(tmp_path, 'w', encoding='utf-8')
+        with f:
+            f.write(first)
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    
+    def append(self, path, data):
+        if isinstance(data, bytes):
+            f = open(path, 'ab')
+        else:
+            f = open(path, 'a', encoding='utf-8')
+        with f:
+            f.write(data)
+    
+    def drain_completions(self):
+        while True:
+            try:
+                on_done, error = self.completions.get_nowait()
+            except queue.Empty:
+                return
+            on_done(error)
+    
+    def close(self, timeout=5):
+        # Flushes everything already queued before the thread exits
+        self.requests.put(None)
+        self.thread.join(timeout)
+        self.drain_completions()
+
+# -------------------- History Journal -------------------- #
+class HistoryJournal:
+    # Append-only JSON-lines segments. Each save appends only new records to
+    # the active segment; compaction writes a snapshot segment of the retained
+    # conversations in the background and drops the segments it replaces.
+    def __init__(self, directory, retention=50, compact_every=200, writer=None):
+        self.directory = directory
+        self.retention = retention
+        self.compact_every = compact_every
+        self.writer = writer
+        self.lock = threading.Lock()
+        self.live = {}  # seq -> conversation, in insertion order
+        self.next_seq = 1
+        self.records_since_compact = 0
+        self.compacting = False
+        
+        os.makedirs(self.directory, exist_ok=True)
+        self.active_id = max(self.segment_ids(), default=1)
+    
+    def segment_ids(self):
+        ids = []
+        for name in os.listdir(self.directory):
+            stem, ext = os.path.splitext(name)
+            if ext == ".jsonl" and stem.isdigit():
+                ids.append(int(stem))
+        return sorted(ids)
+    
+    def segment_path(self, segment_id):
+        return os.path.join(self.directory, f"{segment_id:08d}.jsonl")
+    
+    def is_empty(self):
+        return not self.segment_ids()
+    
+    def replay(self):
+        live = {}
+        for segment_id in self.segment_ids():
+            with open(self.segment_path(segment_id), 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # Torn write at the tail of a segment
+                    
+                    op = record.get("op")
+                    if op in ("snapshot", "clear"):
+                        live.clear()
+                    elif op == "begin":
+                        live[record["seq"]] = {
+                            "session_id": record["session_id"],
+                            "timestamp": record["timestamp"],
+                            "message_count": 0,
+                            "messages": []
+                        }
+                    elif op == "append":
+                        conv = live.get(record["seq"])
+                        if conv is not None:
+                            conv["messages"].extend(Message.from_dict(msg) for msg in record["messages"])
+                            conv["message_count"] = len(conv["messages"])
+        
+        with self.lock:
+            self.live = live
+            self.next_seq = max(live, default=0) + 1
+            self.trim()
+            return list(self.live.values())
+    
+    def trim(self):
+        while len(self.live) > self.retention:
+            del self.live[next(iter(self.live))]
+    
+    def write_records(self, records):
+        data = "".join(json.dumps(record, default=record_to_json) + "\n" for record in records)
+        if self.writer is not None:
+            self.writer.append_file(self.segment_path(self.active_id), data)
+        else:
+            with open(self.segment_path(self.active_id), 'a') as f:
+                f.write(data)
+        self.records_since_compact += len(records)
+    
+    def append_conversation(self, conversation):
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            self.live[seq] = conversation
+            self.trim()
+            self.write_records([
+                {"op": "begin", "seq": seq, "session_id": conversation["session_id"],
+                 "timestamp": conversation["timestamp"]},
+                {"op": "append", "seq": seq, "messages": conversation["messages"]}
+            ])
+            due = self.records_since_compact >= self.compact_every
+        
+        if due:
+            self.compact_async()
+        return seq
+    
+    def append_messages(self, seq, conversation, messages, updated=None):
+        # The in-memory record is extended (or, for a session view, replaced
+        # by the longer view in updated) under the lock so a concurrent
+        # compaction snapshot never sees a delta that is also journaled after it
+        with self.lock:
+            if updated is None:
+                conversation["messages"].extend(messages)
+            else:
+                conversation["messages"] = updated
+            conversation["message_count"] = len(conversation["messages"])
+            self.write_records([{"op": "append", "seq": seq, "messages": messages}])
+            due = self.records_since_compact >= self.compact_every
+        
+        if due:
+            self.compact_async()
+    
+    def snapshot_records(self, items, batch=500):
+        # Messages go out in batches of appends, so a long session is
+        # streamed from its view instead of materialized
+        yield {"op": "snapshot"}
+        for seq, conv, messages in items:
+            yield {"op": "begin", "seq": seq, "session_id": conv["session_id"], "timestamp": conv["timestamp"]}
+            messages = iter(messages)
+            while True:
+                chunk = list(itertools.islice(messages, batch))
+                if not chunk:
+                    break
+                yield {"op": "append", "seq": seq, "messages": chunk}
+    
+    def roll(self):
+        # Caller holds the lock. Reserves a snapshot slot between the old
+        # segments and the new active segment.
+        items = [(seq, conv, conv["messages"][:]) for seq, conv in self.live.items()]
+        old_id = self.active_id
+        self.active_id = old_id + 2
+        self.records_since_compact = 0
+        return old_id, items
+    
+    def write_snapshot(self, old_id, items):
+        path = self.segment_path(old_id + 1)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            for record in self.snapshot_records(items):
+                f.write(json.dumps(record, default=record_to_json) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        
+        for segment_id in self.segment_ids():
+            if segment_id <= old_id:
+                try:
+                    os.remove(self.segment_path(segment_id))
+                except OSError:
+                    pass
+    
+    def compact(self):
+        with self.lock:
+            old_id, items = self.roll()
+        self.write_snapshot(old_id, items)
+    
+    def compact_async(self):
+        with self.lock:
+            if self.compacting:
+                return
+            self.compacting = True
+            old_id, items = self.roll()
+        
+        def run():
+            try:
+                self.write_snapshot(old_id, items)
+            except OSError:
+                pass
+            finally:
+                with self.lock:
+                    self.compacting = False
+        
+        # Queued behind any appends to the segments being replaced
+        if self.writer is not None:
+            self.writer.call(run)
+        else:
+            threading.Thread(target=run, daemon=True).start()
+    
+    def rewrite(self, conversations):
+        # Replace the journal contents with exactly these conversations;
+        # records already in the journal keep their sequence numbers
+        with self.lock:
+            seqs = {id(conv): seq for seq, conv in self.live.items()}
+            self.live = {}
+            for conv in conversations:
+                seq = seqs.get(id(conv))
+                if seq is None:
+                    seq = self.next_seq
+                    self.next_seq += 1
+                self.live[seq] = conv
+            self.trim()
+            old_id, items = self.roll()
+        
+        if self.writer is not None:
+            self.writer.call(lambda: self.write_snapshot(old_id, items))
+        else:
+            self.write_snapshot(old_id, items)
 
 # -------------------- Chat History Manager -------------------- #
 class ChatHistory:
-    def __init__(self):
+    def __init__(self, storage="json", retention=50, writer=None):
         self.history_file = "chat_history.json"
-        self.conversations = self.load_history()
+        self.journal_dir = "chat_history.journal"
+        self.storage = storage
+        self.retention = retention
+        self.writer = writer
+        self.journal = None
+        self.search_index = None
+        self.persisted = {}  # session_id -> [conversation, journal seq, message offset]
+        self.metadata = {}   # record key -> compact session row, oldest first
+        
+        # Loaded on first access (or by the background warm-up)
+        self.loaded_conversations = None
+        self.load_lock = threading.Lock()
+    
+    def ensure_loaded(self):
+        if self.loaded_conversations is not None:
+            return
+        
+        with self.load_lock:
+            if self.loaded_conversations is None:
+                with STARTUP.measure("history load"):
+                    if self.storage == "journal":
+                        self.journal = HistoryJournal(self.journal_dir, self.retention, writer=self.writer)
+                        conversations = self.load_journal()
+                        with self.journal.lock:
+                            items = list(self.journal.live.items())
+                    else:
+                        conversations = self.load_history()
+                        items = [(self.record_key(conv, None), conv) for conv in conversations]
+                    self.metadata = {key: self.session_entry(key, conv) for key, conv in items}
+                    self.loaded_conversations = conversations
+    
+    @property
+    def conversations(self):
+        self.ensure_loaded()
+        return self.loaded_conversations
+    
+    @conversations.setter
+    def conversations(self, value):
+        self.ensure_loaded()
+        self.loaded_conversations = value
         
     def load_history(self):
         try:
             if os.path.exists(self.history_file):
                 with open(self.history_file, 'r') as f:
-                    return json.load(f)
+                    conversations = json.load(f)
+                for conv in conversations:
+                    conv["messages"] = [Message.from_dict(msg) for msg in conv.get("messages", [])]
+                return conversations
+        except ValueError:
+            # Keep the unreadable file aside instead of overwriting it later
+            try:
+                os.replace(self.history_file, self.history_file + ".corrupt")
+            except OSError:
+                pass
         except:
             pass
         return []
     
+    def load_journal(self):
+        # First run in journal mode imports the legacy JSON document once
+        if self.journal.is_empty():
+            legacy = self.load_history()
+            if legacy:
+                # The snapshot may still be queued on the worker, so the
+                # imported records are taken from memory, not replayed
+                self.journal.rewrite(legacy)
+                with self.journal.lock:
+                    return list(self.journal.live.values())
+        
+        try:
+            return self.journal.replay()
+        except OSError:
+            return []
+    
+    def capture(self, messages):
+        # The live session's record reads through its buffer (and spill
+        # file) instead of copying the transcript
+        if isinstance(messages, SessionBuffer):
+            return messages.view()
+        return list(messages)
+    
     def save_conversation(self, messages, session_id):
+        messages = self.capture(messages)
         conversation = {
             "session_id": session_id,
             "timestamp": datetime.now().isoformat(),
             "message_count": len(messages),
             "messages": messages
         }
+        self.ensure_loaded()
         self.conversations.append(conversation)
         
-        # Keep only last 50 conversations
-        if len(self.conversations) > 50:
-            self.conversations = self.conversations[-50:]
-            
-        self.save_to_file()
+        # Keep only the most recent conversations
+        if len(self.conversations) > self.retention:
+            self.conversations = self.conversations[-self.retention:]
+        
+        seq = None
+        if self.journal is not None:
+            try:
+                seq = self.journal.append_conversation(conversation)
+            except OSError:
+                pass
+        else:
+            self.save_to_file()
+        
+        key = self.record_key(conversation, seq)
+        self.index_messages(key, session_id, conversation["messages"])
+        live = self.live_keys()
+        self.metadata[key] = self.session_entry(key, conversation)
+        for stale in [record for record in self.metadata if record not in live]:
+            del self.metadata[stale]
+        if self.search_index is not None:
+            self.search_index.retain(live)
+        return conversation, seq
+    
+    def sync_conversation(self, messages, session_id):
+        # Upserts only the messages added since the last sync of this session.
+        # Returns False without touching the disk when nothing has changed.
+        self.ensure_loaded()
+        entry = self.persisted.get(session_id)
+        if entry is not None:
+            conversation, seq, offset = entry
+            retained = any(conv is conversation for conv in self.conversations)
+            if not retained or offset > len(messages):
+                entry = None
+        
+        if entry is None:
+            if not messages:
+                return False
+            conversation, seq = self.save_conversation(messages, session_id)
+            self.persisted[session_id] = [conversation, seq, len(messages)]
+            return True
+        
+        if offset == len(messages):
+            return False
+        
+        delta = messages[offset:]
+        updated = messages.view() if isinstance(messages, SessionBuffer) else None
+        if self.journal is not None:
+            try:
+                self.journal.append_messages(seq, conversation, delta, updated)
+            except OSError:
+                pass
+        else:
+            if updated is None:
+                conversation["messages"].extend(delta)
+            else:
+                conversation["messages"] = updated
+            conversation["message_count"] = len(conversation["messages"])
+            self.save_to_file()
+        
+        key = self.record_key(conversation, seq)
+        self.metadata[key] = self.session_entry(key, conversation)
+        self.index_messages(key, session_id, delta, offset)
+        entry[2] = len(messages)
+        return True
+    
+    def end_conversation(self, session_id):
+        # The next sync for this session starts a new history record
+        self.persisted.pop(session_id, None)
     
     def save_to_file(self):
+        self.ensure_loaded()
+        if self.journal is not None:
+            try:
+                self.journal.rewrite(self.conversations)
+            except OSError:
+                pass
+            return
+        
+        if self.writer is not None:
+            # Shallow snapshot here; serialization happens on the worker
+            snapshot = [dict(conv, messages=conv["messages"][:]) for conv in self.conversations]
+            self.writer.write_file(self.history_file,
+                                   lambda: json.dumps(snapshot, indent=2, default=record_to_json))
+            return
+        
         try:
             with open(self.history_file, 'w') as f:
-                json.dump(self.conversations, f, indent=2)
+                json.dump(self.conversations, f, indent=2, default=record_to_json)
         except:
             pass
     
-    def export_conversation(self, session_id, filename):
+    def session_entry(self, key, conv):
+        # Compact metadata row: (key, session_id, start, end, message_count)
+        messages = conv.get("messages") or []
+        start = messages[0].get("timestamp") if messages else None
+        end = messages[-1].get("timestamp") if messages else None
+        return (key, conv["session_id"], start or conv.get("timestamp", ""),
+                end or conv.get("timestamp", ""), conv["message_count"])
+    
+    def count_sessions(self):
+        self.ensure_loaded()
+        return len(self.metadata)
+    
+    def session_page(self, page, page_size=100):
+        # Newest first, from the metadata rows; keys are record keys, so
+        # they still name the same session after retention trims history
+        self.ensure_loaded()
+        start = page * page_size
+        return list(itertools.islice(reversed(self.metadata.values()), start, start + page_size))
+    
+    def load_messages(self, key):
+        self.ensure_loaded()
+        if self.journal is not None:
+            with self.journal.lock:
+                conv = self.journal.live.get(key)
+        else:
+            conv = next((conv for conv in self.conversations if self.record_key(conv, None) == key), None)
+        return list(conv["messages"]) if conv is not None else []
+    
+    def sent_messages(self, sender="You"):
+        # Texts sent by sender across the retained history, oldest first
+        return [msg.get("message") for conv in self.conversations for msg in conv["messages"]
+                if msg.get("sender") == sender and msg.get("message")]
+    
+    def recent_conversations(self, limit=10):
+        return [{"session_id": conv["session_id"],
+                 "timestamp": conv.get("timestamp", ""),
+                 "message_count": conv["message_count"]}
+                for conv in self.conversations[-limit:]]
+    
+    def get_conversation(self, session_id):
         for conv in self.conversations:
             if conv["session_id"] == session_id:
-                with open(filename, 'w') as f:
-                    json.dump(conv, f, indent=2)
-                return True
-        return False
+                return conv
+        return None
+    
+    def clear(self):
+        self.conversations.clear()
+        self.persisted.clear()
+        self.metadata.clear()
+        self.save_to_file()
+        if self.search_index is not None:
+            self.search_index.clear()
+    
+    def record_key(self, conversation, seq):
+        # Identifies a history record in the search index: its journal
+        # sequence number, or its save timestamp in the plain JSON file
+        return seq if seq is not None else conversation["timestamp"]
+    
+    def records(self):
+        # (record key, conversation) for every conversation in history
+        self.ensure_loaded()
+        if self.journal is not None:
+            with self.journal.lock:
+                return list(self.journal.live.items())
+        return [(self.record_key(conv, None), conv) for conv in self.conversations]
+    
+    def live_keys(self):
+        # Record keys of the conversations in history, without their messages
+        self.ensure_loaded()
+        if self.journal is not None:
+            with self.journal.lock:
+                return set(self.journal.live)
+        return {self.record_key(conv, None) for conv in self.conversations}
+    
+    def ensure_search_index(self):
+        # The first load of an index that was never written indexes the
+        # conversations already in history
+        if self.search_index is not None and not self.search_index.loaded:
+            self.search_index.load(self.live_keys, self.records)
+    
+    def index_messages(self, record, session_id, messages, start=0):
+        if self.search_index is not None:
+            self.ensure_search_index()
+            self.search_index.add_messages(record, session_id, messages, start)
+    
+    def search(self, query, limit=20):
+        if self.search_index is None:
+            return []
+        self.ensure_search_index()
+        return self.search_index.search(query, limit, self.message_lookup())
+    
+    def message_lookup(self):
+        # fetch(record, position) for search hits, over the records in history
+        records = dict(self.records())
+        
+        def fetch(record, position):
+            conv = records.get(record)
+            messages = conv["messages"] if conv is not None else ()
+            return messages[position] if 0 <= position < len(messages) else None
+        return fetch
+    
+    def export_conversation(self, session_id, filename):
+        conv = self.get_conversation(session_id)
+        if conv is None:
+            return False
+        with open(filename, 'w') as f:
+            json.dump(conv, f, indent=2, default=record_to_json)
+        return True
+
+# -------------------- SQLite History Store -------------------- #
+class SQLiteChatHistory(ChatHistory):
+    # Normalized sessions/messages tables in a WAL-mode database. Writes are
+    # buffered and applied as one transaction per flush (on the persistence
+    # worker when there is one); lookups use indexed queries instead of
+    # scanning a list, and retention is a DELETE policy rather than slicing.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            start_time TEXT,
+            end_time TEXT
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            conversation_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            sender TEXT,
+            type TEXT,
+            timestamp TEXT,
+            message TEXT,
+            extra TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_session_id ON sessions(session_id);
+        CREATE INDEX IF NOT EXISTS idx_sessions_timestamp ON sessions(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, position);
+        CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(sender);
+    """
+    MESSAGE_FIELDS = ("sender", "type", "timestamp", "message")
+    
+    def __init__(self, db_file="chat_history.db", retention=50, max_age_days=None, writer=None):
+        super().__init__("sqlite", retention, writer)
+        self.db_file = db_file
+        self.max_age_days = max_age_days
+        self.connection = None
+        self.next_id = 1
+        self.db_lock = threading.Lock()
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        self.flush_scheduled = False
+        self.evicted = set()  # Row ids dropped by retention since their last sync
+    
+    def ensure_loaded(self):
+        if self.connection is not None:
+            return
+        
+        with self.load_lock:
+            if self.connection is None:
+                with STARTUP.measure("history load"):
+                    connection = sqlite3.connect(self.db_file, check_same_thread=False)
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.execute("PRAGMA synchronous=NORMAL")
+                    connection.executescript(self.SCHEMA)
+                    columns = {row[1] for row in connection.execute("PRAGMA table_info(sessions)")}
+                    for column in ("start_time", "end_time"):
+                        if column not in columns:
+                            connection.execute(f"ALTER TABLE sessions ADD COLUMN {column} TEXT")
+                    self.next_id = (connection.execute("SELECT MAX(id) FROM sessions").fetchone()[0] or 0) + 1
+                    with connection:  # Rows left behind by sessions retention already removed
+                        connection.execute("DELETE FROM messages WHERE conversation_id NOT IN (SELECT id FROM sessions)")
+                    self.connection = connection
+                    
+                    # First run imports the legacy JSON document once
+                    if self.next_id == 1:
+                        for conv in self.load_history():
+                            self.insert_conversation(conv.get("messages", []), conv["session_id"],
+                                                     conv.get("timestamp", datetime.now().isoformat()))
+                        self.flush()
+    
+    @property
+    def conversations(self):
+        # Compatibility view only; materializes every stored conversation
+        return [conv for _, conv in self.records()]
+    
+    def records(self):
+        self.ensure_loaded()
+        self.flush()
+        with self.db_lock:
+            ids = [row[0] for row in self.connection.execute("SELECT id FROM sessions ORDER BY id")]
+        return [(conv_id, self.load_conversation(conv_id)) for conv_id in ids]
+    
+    def live_keys(self):
+        # Row ids in the database plus those still queued for the next
+        # flush; reads one indexed column and never flushes
+        self.ensure_loaded()
+        with self.db_lock:
+            ids = {row[0] for row in self.connection.execute("SELECT id FROM sessions")}
+        return ids.union(range(max(ids, default=0) + 1, self.next_id))
+    
+    def message_rows(self, conv_id, messages, start=0):
+        rows = []
+        for position, msg in enumerate(messages, start):
+            if isinstance(msg, Message):
+                extra = msg.extra
+            else:
+                extra = {k: v for k, v in msg.items() if k not in self.MESSAGE_FIELDS}
+            rows.append((conv_id, position, msg.get("sender"), msg.get("type"), msg.get("timestamp"),
+                         msg.get("message"), json.dumps(extra) if extra else None))
+        return rows
+    
+    def insert_conversation(self, messages, session_id, timestamp=None):
+        conv_id = self.next_id
+        self.next_id += 1
+        timestamp = timestamp or datetime.now().isoformat()
+        start = messages[0].get("timestamp") if messages else None
+        end = messages[-1].get("timestamp") if messages else None
+        self.queue("INSERT INTO sessions (id, session_id, timestamp, message_count, start_time, end_time) "
+                   "VALUES (?, ?, ?, ?, ?, ?)",
+                   [(conv_id, session_id, timestamp, len(messages), start or timestamp, end or timestamp)])
+        self.queue("INSERT INTO messages (conversation_id, position, sender, type, timestamp, message, extra) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?)", self.message_rows(conv_id, messages))
+        return conv_id
+    
+    def queue(self, sql, rows):
+        with self.pending_lock:
+            self.pending.append((sql, rows))
+            if self.writer is None or self.flush_scheduled:
+                schedule = False
+            else:
+                self.flush_scheduled = schedule = True
+        
+        if self.writer is None:
+            self.flush()
+        elif schedule:
+            self.writer.call(self.flush)
+    
+    def flush(self):
+        with self.pending_lock:
+            pending, self.pending = self.pending, []
+            self.flush_scheduled = False
+        if not pending or self.connection is None:
+            return
+        
+        with self.db_lock:
+            with self.connection:  # One transaction for the whole batch
+                for sql, rows in pending:
+                    self.connection.executemany(sql, rows)
+                self.apply_retention()
+    
+    def apply_retention(self):
+        # Caller holds db_lock inside a transaction
+        stale = "SELECT id FROM sessions ORDER BY id DESC LIMIT -1 OFFSET ?"
+        params = (self.retention,)
+        if self.max_age_days:
+            cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+            stale = f"SELECT id FROM ({stale}) UNION SELECT id FROM sessions WHERE timestamp < ?"
+            params = (self.retention, cutoff)
+        
+        ids = [(row[0],) for row in self.connection.execute(stale, params)]
+        if ids:
+            self.connection.executemany("DELETE FROM messages WHERE conversation_id = ?", ids)
+            self.connection.executemany("DELETE FROM sessions WHERE id = ?", ids)
+            # The next sync of these sessions starts a new conversation
+            self.evicted.update(conv_id for conv_id, in ids)
+            if self.search_index is not None:
+                self.search_index.remove(conv_id for conv_id, in ids)
+    
+    def save_conversation(self, messages, session_id):
+        self.ensure_loaded()
+        conv_id = self.insert_conversation(messages, session_id)
+        self.index_messages(conv_id, session_id, messages)
+        return conv_id, None
+    
+    def sync_conversation(self, messages, session_id):
+        self.ensure_loaded()
+        entry = self.persisted.get(session_id)
+        if entry is not None:
+            conv_id, offset = entry
+            # Ids grow monotonically, so anything this far back was evicted;
+            # age-based eviction is reported by apply_retention
+            evicted = conv_id <= self.next_id - 1 - self.retention or conv_id in self.evicted
+            if evicted or offset > len(messages):
+                self.evicted.discard(conv_id)
+                entry = None
+        
+        if entry is None:
+            if not messages:
+                return False
+            conv_id, _ = self.save_conversation(messages, session_id)
+            self.persisted[session_id] = [conv_id, len(messages)]
+            return True
+        
+        if offset == len(messages):
+            return False
+        
+        # Retention may delete the session before this batch is flushed; the
+        # guard keeps those rows from being written as orphans
+        delta = messages[offset:]
+        self.queue("INSERT INTO messages (conversation_id, position, sender, type, timestamp, message, extra) "
+                   "SELECT ?, ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM sessions WHERE id = ?)",
+                   [row + (conv_id,) for row in self.message_rows(conv_id, delta, offset)])
+        end = delta[-1].get("timestamp") or datetime.now().isoformat()
+        self.queue("UPDATE sessions SET message_count = ?, end_time = ? WHERE id = ?",
+                   [(len(messages), end, conv_id)])
+        self.index_messages(conv_id, session_id, delta, offset)
+        entry[1] = len(messages)
+        return True
+    
+    def save_to_file(self):
+        self.ensure_loaded()
+        self.flush()
+    
+    def load_conversation(self, conv_id):
+        with self.db_lock:
+            row = self.connection.execute(
+                "SELECT session_id, timestamp, message_count FROM sessions WHERE id = ?", (conv_id,)).fetchone()
+            if row is None:
+                return None
+            message_rows = self.connection.execute(
+                "SELECT sender, type, timestamp, message, extra FROM messages "
+                "WHERE conversation_id = ? ORDER BY position", (conv_id,)).fetchall()
+        
+        messages = []
+        for sender, msg_type, timestamp, message, extra in message_rows:
+            msg = json.loads(extra) if extra else {}
+            for key, value in zip(self.MESSAGE_FIELDS, (sender, msg_type, timestamp, message)):
+                if value is not None:
+                    msg[key] = value
+            messages.append(Message.from_dict(msg))
+        
+        return {
+            "session_id": row[0],
+            "timestamp": row[1],
+            "message_count": row[2],
+            "messages": messages
+        }
+    
+    def count_sessions(self):
+        self.ensure_loaded()
+        with self.db_lock:
+            return self.connection.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+    
+    def message_lookup(self):
+        def fetch(conv_id, position):
+            with self.db_lock:
+                row = self.connection.execute(
+                    "SELECT sender, timestamp, message FROM messages WHERE conversation_id = ? AND position = ?",
+                    (conv_id, position)).fetchone()
+            return dict(zip(("sender", "timestamp", "message"), row)) if row else None
+        return fetch
+    
+    def session_page(self, page, page_size=100):
+        # Reads only the sessions table; keys are row ids
+        self.ensure_loaded()
+        with self.db_lock:
+            rows = self.connection.execute(
+                "SELECT id, session_id, COALESCE(start_time, timestamp), COALESCE(end_time, timestamp), "
+                "message_count FROM sessions ORDER BY id DESC LIMIT ? OFFSET ?",
+                (page_size, page * page_size)).fetchall()
+        return [tuple(row) for row in rows]
+    
+    def load_messages(self, key):
+        self.ensure_loaded()
+        conv = self.load_conversation(key)
+        return conv["messages"] if conv else []
+    
+    def sent_messages(self, sender="You"):
+        self.ensure_loaded()
+        with self.db_lock:
+            rows = self.connection.execute(
+                "SELECT message FROM messages WHERE sender = ? AND message IS NOT NULL "
+                "ORDER BY conversation_id, position", (sender,)).fetchall()
+        return [row[0] for row in rows]
+    
+    def recent_conversations(self, limit=10):
+        self.ensure_loaded()
+        with self.db_lock:
+            rows = self.connection.execute(
+                "SELECT session_id, timestamp, message_count FROM sessions ORDER BY id DESC LIMIT ?",
+                (limit,)).fetchall()
+        return [{"session_id": session_id, "timestamp": timestamp, "message_count": count}
+                for session_id, timestamp, count in reversed(rows)]
+    
+    def get_conversation(self, session_id):
+        self.ensure_loaded()
+        with self.db_lock:
+            row = self.connection.execute(
+                "SELECT id FROM sessions WHERE session_id = ? ORDER BY id LIMIT 1", (session_id,)).fetchone()
+        return self.load_conversation(row[0]) if row else None
+    
+    def clear(self):
+        self.ensure_loaded()
+        self.persisted.clear()
+        self.queue("DELETE FROM messages", [()])
+        self.queue("DELETE FROM sessions", [()])
+        if self.search_index is not None:
+            self.search_index.clear()
+
+# -------------------- Search Index -------------------- #
+class SearchIndex:
+    # Inverted index over stored message text with BM25 ranking. Documents are
+    # keyed by (history record, position): the record is the journal sequence
+    # number, SQLite row id or save timestamp of the conversation, so a session
+    # that starts a new record after Clear Chat is indexed again. Only the key
+    # and term counts are kept; hit text is fetched back from history. Term
+    # counts are appended as messages are saved and logged as JSON lines next
+    # to the history; records evicted by retention are dropped from search at
+    # once and from the postings and the log when enough of them pile up.
+    TOKEN_RE = re.compile(r"\w+")
+    K1 = 1.2
+    B = 0.75
+    COMPACT_MIN = 1000  # Removed documents tolerated before compaction
+    
+    def __init__(self, index_file="chat_history.index", writer=None):
+        self.index_file = index_file
+        self.writer = writer
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.reset()
+    
+    def reset(self):
+        self.docs = []           # doc id -> (record, position), None once removed
+        self.lengths = array("I")  # doc id -> token count
+        self.postings = {}       # term -> array of doc id, term frequency pairs in doc id order
+        self.total_length = 0
+        self.seen = set()     # (record, position) already indexed
+        self.records = {}     # record -> session_id, or None once evicted from history
+        self.removed = 0      # Documents of evicted records still in the postings
+    
+    def tokenize(self, text):
+        return self.TOKEN_RE.findall(text.lower())
+    
+    @staticmethod
+    def pairs(entries):
+        # (doc id, term frequency) from a flat postings array
+        items = iter(entries)
+        return zip(items, items)
+    
+    def term_counts(self, text):
+        counts = {}
+        for token in self.tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        return counts
+    
+    def read_log(self):
+        # Logged documents, or None when the file is missing or predates
+        # record keys and the index has to be rebuilt from history
+        logged = []
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        logged.append(json.loads(line))
+                    except ValueError:
+                        break  # Torn write at the tail
+        if logged and all("r" in entry and "w" in entry for entry in logged):
+            return logged
+        return None
+    
+    def load(self, live_keys, bootstrap):
+        # live_keys() is the set of record keys still in history and decides
+        # which logged documents are kept; bootstrap() yields the (record,
+        # conversation) pairs and is only read when there is no usable log
+        if self.loaded:
+            return
+        logged = self.read_log()
+        # Outside the lock: SQLite retention reports evictions here
+        live = live_keys() if logged is not None else dict(bootstrap())
+        
+        with self.lock:
+            if self.loaded:
+                return
+            
+            if logged is not None:
+                for entry in logged:
+                    if entry["r"] in live:
+                        self.add_document(entry["r"], entry["s"], entry["p"], entry["w"])
+                if len(self.docs) < len(logged):
+                    self.rewrite()
+            else:
+                for record, conv in live.items():
+                    self.add_locked(record, conv["session_id"], conv.get("messages", []), 0, log=False)
+                self.rewrite()
+            
+            self.loaded = True
+    
+    def add_document(self, record, session_id, position, counts):
+        key = (record, position)
+        if key in self.seen or self.records.get(record, session_id) is None:
+            return False
+        self.seen.add(key)
+        self.records[record] = session_id
+        
+        doc_id = len(self.docs)
+        length = sum(counts.values())
+        self.docs.append(key)
+        self.lengths.append(length)
+        self.total_length += length
+        for term, tf in counts.items():
+            entries = self.postings.get(term)
+            if entries is None:
+                entries = self.postings[term] = array("I")
+            entries.append(doc_id)
+            entries.append(tf)
+        return True
+    
+    def log_line(self, record, position, counts):
+        return json.dumps({"r": record, "s": self.records[record], "p": position, "w": counts}) + "\n"
+    
+    def add_locked(self, record, session_id, messages, start, log=True):
+        lines = []
+        for position, msg in enumerate(messages, start):
+            text = msg.get("message")
+            if not text:
+                continue
+            counts = self.term_counts(text)
+            if self.add_document(record, session_id, position, counts):
+                lines.append(self.log_line(record, position, counts))
+        
+        if lines and log:
+            data = "".join(lines)
+            if self.writer is not None:
+                self.writer.append_file(self.index_file, data)
+            else:
+                with open(self.index_file, 'a', encoding='utf-8') as f:
+                    f.write(data)
+    
+    def add_messages(self, record, session_id, messages, start=0):
+        with self.lock:
+            self.add_locked(record, session_id, messages, start)
+    
+    def remove(self, records):
+        # Records evicted from history stop matching immediately
+        with self.lock:
+            evicted = set()
+            for record in records:
+                if self.records.get(record) is not None or record not in self.records:
+                    self.records[record] = None
+                    evicted.add(record)
+            if not evicted:
+                return
+            
+            for doc_id, doc in enumerate(self.docs):
+                if doc is not None and doc[0] in evicted:
+                    self.docs[doc_id] = None
+                    self.total_length -= self.lengths[doc_id]
+                    self.removed += 1
+            
+            if self.removed >= max(self.COMPACT_MIN, len(self.docs) - self.removed):
+                self.compact()
+    
+    def retain(self, records):
+        # Drops every indexed record not in records
+        with self.lock:
+            stale = [record for record, session_id in self.records.items()
+                     if session_id is not None and record not in records]
+        if stale:
+            self.remove(stale)
+    
+    def compact(self):
+        # Caller holds the lock. Renumbers the live documents, filters the
+        # postings and rewrites the log without the evicted records.
+        remap = []
+        docs = []
+        lengths = array("I")
+        for doc_id, doc in enumerate(self.docs):
+            if doc is None:
+                remap.append(None)
+            else:
+                remap.append(len(docs))
+                docs.append(doc)
+                lengths.append(self.lengths[doc_id])
+        
+        postings = {}
+        for term, entries in self.postings.items():
+            kept = array("I")
+            for doc_id, tf in self.pairs(entries):
+                if remap[doc_id] is not None:
+                    kept.append(remap[doc_id])
+                    kept.append(tf)
+            if kept:
+                postings[term] = kept
+        
+        self.docs, self.lengths, self.postings = docs, lengths, postings
+        self.seen = set(docs)
+        self.removed = 0
+        self.rewrite()
+    
+    def render(self):
+        # Caller holds the lock. Log lines of the live documents, with their
+        # term counts regrouped from the postings.
+        counts = {}
+        for term, entries in self.postings.items():
+            for doc_id, tf in self.pairs(entries):
+                if self.docs[doc_id] is not None:
+                    counts.setdefault(doc_id, {})[term] = tf
+        return "".join(self.log_line(*self.docs[doc_id], counts.get(doc_id, {}))
+                       for doc_id in range(len(self.docs)) if self.docs[doc_id] is not None)
+    
+    def snapshot(self):
+        with self.lock:
+            return self.render()
+    
+    def rewrite(self):
+        # The log is rendered when the worker writes it, so documents added
+        # (and appended) in the meantime are never lost; duplicates of them
+        # are skipped on load
+        if self.writer is not None:
+            self.writer.write_file(self.index_file, self.snapshot)
+        else:
+            with open(self.index_file, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+    
+    def clear(self):
+        with self.lock:
+            self.reset()
+            self.loaded = True
+            self.rewrite()
+    
+    def snippet(self, text, terms, width=80):
+        lower = text.lower()
+        hit = min((lower.find(term) for term in terms if term in lower), default=0)
+        start = max(0, hit - width // 3)
+        end = min(len(text), start + width)
+        snippet = text[start:end].replace("\n", " ")
+        return ("..." if start else "") + snippet + ("..." if end < len(text) else "")
+    
+    def search(self, query, limit=20, fetch=None):
+        # fetch(record, position) returns the stored message, or None once it
+        # has left history; it runs outside the lock
+        terms = list(dict.fromkeys(self.tokenize(query)))
+        with self.lock:
+            doc_count = len(self.docs) - self.removed
+            if not terms or not doc_count:
+                return []
+            avg_length = self.total_length / doc_count
+            
+            docs, lengths = self.docs, self.lengths
+            base = self.K1 * (1 - self.B)
+            scale = self.K1 * self.B / avg_length
+            scores = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings) // 2
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5)) * (self.K1 + 1)
+                for doc_id, tf in self.pairs(postings):
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf / (tf + base + scale * lengths[doc_id])
+            
+            # Documents of evicted records are skipped only when ranking
+            ranked = heapq.nlargest(limit, ((doc_id, score) for doc_id, score in scores.items()
+                                            if docs[doc_id] is not None), key=lambda item: item[1])
+            best = [(docs[doc_id], self.records[docs[doc_id][0]], score) for doc_id, score in ranked]
+        
+        hits = []
+        for (record, position), session_id, score in best:
+            msg = {} if fetch is None else fetch(record, position)
+            if msg is None:
+                continue
+            text = msg.get("message") or ""
+            hits.append({
+                "session_id": session_id,
+                "position": position,
+                "sender": msg.get("sender"),
+                "timestamp": msg.get("timestamp"),
+                "score": score,
+                "snippet": self.snippet(text, terms) if text else ""
+            })
+        return hits
+
+def open_history(config, writer=None):
+    if config.history_storage == "sqlite":
+        history = SQLiteChatHistory(retention=config.history_retention,
+                                    max_age_days=config.history_max_age_days, writer=writer)
+    else:
+        history = ChatHistory(config.history_storage, config.history_retention, writer)
+    
+    if config.search_index:
+        history.search_index = SearchIndex(writer=writer)
+    return history
 
 # -------------------- Conversation Memory -------------------- #
+class RingBuffer:
+    # Fixed-capacity FIFO over a plain list, for the per-session buffers.
+    # A deque with maxlen allocates a 64-slot block (~760 bytes) however
+    # small the capacity; this costs the list and maxlen slots.
+    __slots__ = ("items", "start", "maxlen")
+    
+    def __init__(self, iterable=(), maxlen=10):
+        self.items = []
+        self.start = 0
+        self.maxlen = maxlen
+        self.extend(iterable)
+    
+    def append(self, item):
+        if len(self.items) < self.maxlen:
+            self.items.append(item)
+        elif self.maxlen:
+            self.items[self.start] = item
+            self.start = (self.start + 1) % self.maxlen
+    
+    def extend(self, iterable):
+        for item in iterable:
+            self.append(item)
+    
+    def clear(self):
+        self.items = []
+        self.start = 0
+    
+    def __len__(self):
+        return len(self.items)
+    
+    def __iter__(self):
+        items, start = self.items, self.start
+        return itertools.chain(items[start:], items[:start])
+    
+    def __getitem__(self, index):
+        size = len(self.items)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("ring buffer index out of range")
+        return self.items[(self.start + index) % size]
+
+class TopicTracker:
+    # Session-wide topic counts, updated once per exchange. The lexicon is a
+    # table of topic -> phrases compiled into one IntentMatcher; phrases are
+    # padded with spaces and matched against MessageAnalysis.padded, so they
+    # only hit whole words ("hi" is not found in "this").
+    LEXICON = {
+        "greeting": ["hello", "hi", "hey", "good morning", "good evening"],
+        "mood inquiry": ["how are", "how do you", "how's it going"],
+        "humor": ["joke", "jokes", "funny", "laugh"],
+        "gratitude": ["thanks", "thank you", "appreciate"],
+        "time": ["what time", "time is it", "current time"],
+        "help": ["help", "what can you do", "features"],
+        "farewell": ["bye", "goodbye", "see you", "take care"]
+    }
+    
+    shared_matcher = None
+    __slots__ = ("lexicon", "matcher", "counts", "exchanges")
+    
+    def __init__(self, lexicon=None):
+        self.lexicon = lexicon if lexicon is not None else self.LEXICON
+        self.matcher = self.compile(self.lexicon)
+        self.counts = {}
+        self.exchanges = 0
+    
+    @classmethod
+    def compile(cls, lexicon):
+        # The default lexicon is compiled once and shared by every tracker
+        if lexicon is cls.LEXICON:
+            if cls.shared_matcher is None:
+                cls.shared_matcher = cls.compile(dict(lexicon))
+            return cls.shared_matcher
+        
+        matcher = IntentMatcher()
+        for topic, phrases in lexicon.items():
+            matcher.add_category(topic, [f" {phrase.lower()} " for phrase in phrases])
+        matcher.build()
+        return matcher
+    
+    def add_topic(self, topic, phrases):
+        self.lexicon = dict(self.lexicon)
+        self.lexicon[topic] = list(self.lexicon.get(topic, [])) + list(phrases)
+        self.matcher = self.compile(self.lexicon)
+    
+    def observe(self, analysis):
+        self.exchanges += 1
+        topics = {category for _, _, category in self.matcher.find_all(analysis.padded)}
+        for topic in topics:
+            self.counts[topic] = self.counts.get(topic, 0) + 1
+        return topics
+    
+    def restore(self, counts, exchanges=0):
+        self.counts = dict(counts)
+        self.exchanges = exchanges
+    
+    def clear(self):
+        self.counts.clear()
+        self.exchanges = 0
+    
+    def most_common(self):
+        return sorted(self.counts.items(), key=lambda item: -item[1])
+    
+    def get_state(self):
+        return {"counts": dict(self.counts), "exchanges": self.exchanges}
+
 class ConversationMemory:
-    def __init__(self, max_memory=10):
-        self.memory = deque(maxlen=max_memory)
+    __slots__ = ("memory", "topics", "user_name", "user_mood")
+    
+    def __init__(self, max_memory=10, topics=None):
+        self.memory = RingBuffer(maxlen=max_memory)
+        self.topics = topics if topics is not None else TopicTracker()
         self.user_name = None
         self.user_mood = "neutral"
         
-    def add_exchange(self, user_msg, bot_response):
-        self.memory.append({
-            "user": user_msg,
-            "bot": bot_response,
-            "timestamp": time.time(),
-            "time": datetime.now().strftime("%H:%M:%S")
-        })
+    def add_exchange(self, user_msg, bot_response, analysis=None):
+        # Only the newest exchange keeps its analysis (the next reply's
+        # context check reads it); older ones stay plain text
+        if self.memory:
+            self.memory[-1].analysis = None
+        exchange = Exchange(user_msg, bot_response, analysis=analysis)
+        self.memory.append(exchange)
+        self.topics.observe(exchange.analyzed())
+    
+    def restore(self, exchanges, topics=None):
+        # Loaded sessions bring their saved topic counts; older files only
+        # have the exchanges themselves
+        self.memory = RingBuffer(exchanges, maxlen=self.memory.maxlen)
+        if topics:
+            self.topics.restore(topics.get("counts", {}), topics.get("exchanges", 0))
+        else:
+            self.topics.clear()
+            for exchange in self.memory:
+                self.topics.observe(MessageAnalysis(exchange.user))
+    
+    def get_state(self):
+        return {"memory": [exchange.to_dict() for exchange in self.memory],
+                "topics": self.topics.get_state(), "user_name": self.user_name, "user_mood": self.user_mood}
+    
+    def set_state(self, state):
+        self.restore([Exchange.from_dict(exchange) for exchange in state.get("memory", [])], state.get("topics"))
+        self.user_name = state.get("user_name")
+        self.user_mood = state.get("user_mood", "neutral")
     
     def get_context(self, n=3):
         return list(self.memory)[-n:] if len(self.memory) >= n else list(self.memory)
     
     def clear(self):
         self.memory.clear()
+        self.topics.clear()
     
     def get_conversation_summary(self):
-        if not self.memory:
+        # Session-wide, from the running counts; cost is O(topics)
+        if not self.topics.exchanges:
             return "No conversation yet"
         
-        topics = set()
-        for exchange in self.memory:
-            msg = exchange["user"].lower()
-            if any(word in msg for word in ["hello", "hi", "hey"]):
-                topics.add("greeting")
-            if any(word in msg for word in ["how are", "how do you"]):
-                topics.add("mood inquiry")
-            if any(word in msg for word in ["joke", "funny"]):
-                topics.add("humor")
-            if any(word in msg for word in ["bye", "goodbye"]):
-                topics.add("farewell")
-        
-        return f"Topics discussed: {', '.join(topics) if topics else 'Various'}"
+        topics = self.topics.most_common()
+        listed = ", ".join(f"{topic} ({count})" for topic, count in topics)
+        return f"Topics discussed: {listed if topics else 'Various'}"
+
+# -------------------- Sentiment Tracker -------------------- #
+class SentimentTracker:
+    # Running per-session polarity statistics updated once per user message:
+    # Welford mean/variance over all messages plus an exponential moving
+    # average for the current mood and a bounded trend of EMA samples.
+    TREND_BARS = "▁▂▃▄▅▆▇█"
+    __slots__ = ("ema_alpha", "trend", "count", "mean", "m2", "ema")
+    
+    def __init__(self, ema_alpha=0.3, trend_size=20):
+        self.ema_alpha = ema_alpha
+        self.trend = RingBuffer(maxlen=trend_size)
+        self.reset()
+    
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ema = None
+        self.trend.clear()
+    
+    def update(self, score):
+        self.count += 1
+        delta = score - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (score - self.mean)
+        
+        if self.ema is None:
+            self.ema = score
+        else:
+            self.ema = self.ema_alpha * score + (1 - self.ema_alpha) * self.ema
+        self.trend.append(self.ema)
+    
+    def get_state(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "ema": self.ema, "trend": list(self.trend)}
+    
+    def set_state(self, state):
+        self.reset()
+        self.count = state.get("count", 0)
+        self.mean = state.get("mean", 0.0)
+        self.m2 = state.get("m2", 0.0)
+        self.ema = state.get("ema")
+        self.trend.extend(state.get("trend", []))
+    
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else 0.0
+    
+    @staticmethod
+    def label(score):
+        if score > 0.3:
+            return "positive", "😊"
+        elif score < -0.3:
+            return "negative", "😔"
+        return "neutral", "😐"
+    
+    def trend_line(self):
+        bars = self.TREND_BARS
+        return "".join(bars[min(len(bars) - 1, int((value + 1) / 2 * len(bars)))] for value in self.trend)
+    
+    def get_stats(self):
+        current = self.ema if self.ema is not None else 0.0
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "variance": self.variance,
+            "overall": self.label(self.mean),
+            "current": current,
+            "current_mood": self.label(current),
+            "trend": self.trend_line()
+        }
 
 # -------------------- Session Manager -------------------- #
 class SessionManager:
-    def __init__(self):
+    __slots__ = ("session_id", "start_time", "message_count", "user_messages", "bot_messages", "sentiment")
+    
+    def __init__(self, ema_alpha=0.3):
         self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.start_time = datetime.now()
         self.message_count = 0
         self.user_messages = 0
         self.bot_messages = 0
+        self.sentiment = SentimentTracker(ema_alpha)
         
     def get_stats(self):
         duration = datetime.now() - self.start_time
@@ -175,11 +1817,509 @@ class SessionManager:
             "start_time": self.start_time.strftime("%Y-%m-%d %H:%M:%S"),
             "avg_response_time": "0.5s"  # Could be calculated
         }
+    
+    def get_state(self):
+        return {"session_id": self.session_id, "start_time": self.start_time.isoformat(),
+                "message_count": self.message_count, "user_messages": self.user_messages,
+                "bot_messages": self.bot_messages, "sentiment": self.sentiment.get_state()}
+    
+    def set_state(self, state):
+        self.session_id = state.get("session_id", self.session_id)
+        self.start_time = datetime.fromisoformat(state["start_time"]) if "start_time" in state else self.start_time
+        self.message_count = state.get("message_count", 0)
+        self.user_messages = state.get("user_messages", 0)
+        self.bot_messages = state.get("bot_messages", 0)
+        self.sentiment.set_state(state.get("sentiment", {}))
+
+# -------------------- Intent Matcher -------------------- #
+class IntentMatcher:
+    # Aho-Corasick automaton over every response pattern. Matches are ranked by
+    # pattern length (longest wins), then by category priority (lower wins).
+    # Patterns are added to a staging trie under the lock; build() publishes a
+    # fresh (goto, fail, output) snapshot, so find_all on other threads reads
+    # one consistent table without locking.
+    def __init__(self, responses=None):
+        self.goto = [{}]
+        self.terminal = [[]]
+        self.priority = {}
+        self.tables = ([{}], [0], [[]])
+        self.dirty = False
+        self.lock = threading.RLock()
+        
+        if responses:
+            for category, data in responses.items():
+                self.add_category(category, data["patterns"])
+            self.build()
+    
+    def add_category(self, category, patterns, priority=None):
+        with self.lock:
+            if priority is not None:
+                self.priority[category] = priority
+            elif category not in self.priority:
+                self.priority[category] = len(self.priority)
+            
+            for pattern in patterns:
+                self.add_pattern(pattern, category)
+    
+    def add_pattern(self, pattern, category):
+        pattern = pattern.lower()
+        if not pattern:
+            return
+        
+        with self.lock:
+            node = 0
+            for char in pattern:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.terminal.append([])
+                node = next_node
+            
+            if (pattern, category) not in self.terminal[node]:
+                self.terminal[node].append((pattern, category))
+            self.dirty = True
+    
+    def build(self):
+        # Breadth-first pass computing failure links; each node's output list
+        # is its own patterns plus those of its failure target.
+        with self.lock:
+            goto = [dict(edges) for edges in self.goto]
+            fail = [0] * len(goto)
+            output = [list(patterns) for patterns in self.terminal]
+            
+            queue = deque(goto[0].values())
+            while queue:
+                node = queue.popleft()
+                for char, child in goto[node].items():
+                    state = fail[node]
+                    while state and char not in goto[state]:
+                        state = fail[state]
+                    target = goto[state].get(char, 0)
+                    fail[child] = target if target != child else 0
+                    output[child] = self.terminal[child] + output[fail[child]]
+                    queue.append(child)
+            
+            self.tables = (goto, fail, output)
+            self.dirty = False
+            return self.tables
+    
+    def find_all(self, text):
+        tables = self.tables
+        if self.dirty:
+            with self.lock:
+                tables = self.build() if self.dirty else self.tables
+        
+        goto, fail, output = tables
+        matches = []
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for pattern, category in output[node]:
+                matches.append((index - len(pattern) + 1, pattern, category))
+        return matches
+    
+    def rank(self, match):
+        start, pattern, category = match
+        return (-len(pattern), self.priority.get(category, len(self.priority)), start)
+    
+    def best_match(self, text):
+        matches = self.find_all(text)
+        if not matches:
+            return None
+        return min(matches, key=self.rank)[2]
+
+# -------------------- Intent Classifier -------------------- #
+class IntentClassifier:
+    # TF-IDF model over every category pattern and example utterance, one row
+    # per utterance. Word unigrams and bigrams, sublinear tf, smoothed idf and
+    # L2-normalized rows, so a score is a cosine similarity; a message gets
+    # the category of its best-scoring utterance. The matrix is stored
+    # column-wise (per term: row ids and weights), so scoring touches only the
+    # columns of the message's own terms and the sparse matrix-vector product
+    # is one np.bincount over them. classify_batch does the same for many
+    # messages at once. As in IntentMatcher, utterances are added under the
+    # lock and build() publishes the model as one tuple, so a classification
+    # on another thread never mixes two builds.
+    BATCH_SIZE = 1024
+    
+    def __init__(self, responses=None, threshold=0.3):
+        if load_numpy() is None:
+            raise RuntimeError("The TF-IDF intent classifier requires NumPy")
+        self.threshold = threshold
+        self.documents = {}
+        self.model = None
+        self.dirty = False
+        self.lock = threading.RLock()
+        
+        if responses:
+            for category, data in responses.items():
+                self.add_category(category, data["patterns"] + data.get("examples", []))
+            self.build()
+    
+    def features(self, text):
+        analysis = MessageAnalysis.of(text)
+        return analysis.tokens + analysis.ngrams
+    
+    def add_category(self, category, utterances):
+        added = []
+        for utterance in utterances:
+            document = {}
+            for term in self.features(utterance):
+                document[term] = document.get(term, 0) + 1
+            if document:
+                added.append(document)
+        
+        with self.lock:
+            self.documents.setdefault(category, []).extend(added)
+            self.dirty = True
+    
+    def build(self):
+        with self.lock:
+            self.model = self.fit()
+            self.dirty = False
+            return self.model
+    
+    def fit(self):
+        # Caller holds the lock. (categories, row category ids, vocabulary,
+        # idf, column rows, column values, column starts)
+        categories = list(self.documents)
+        documents = [document for documents in self.documents.values() for document in documents]
+        row_category = np.repeat(np.arange(len(categories)),
+                                 [len(documents) for documents in self.documents.values()])
+        
+        vocabulary = {}
+        doc_freq = []
+        for document in documents:
+            for term in document:
+                term_id = vocabulary.setdefault(term, len(vocabulary))
+                if term_id == len(doc_freq):
+                    doc_freq.append(0)
+                doc_freq[term_id] += 1
+        
+        count = len(documents)
+        idf = np.log((1 + count) / (1 + np.array(doc_freq, dtype=np.float64))) + 1
+        
+        # Coordinate lists, then sorted by term into column slices
+        rows, cols, values = [], [], []
+        for row, document in enumerate(documents):
+            term_ids = [vocabulary[term] for term in document]
+            weights = (1 + np.log(np.fromiter(document.values(), np.float64, len(document)))) * idf[term_ids]
+            weights /= np.linalg.norm(weights) or 1.0
+            rows.append(np.full(len(term_ids), row, dtype=np.int32))
+            cols.append(np.array(term_ids, dtype=np.int32))
+            values.append(weights.astype(np.float32))
+        
+        rows = np.concatenate(rows) if rows else np.zeros(0, np.int32)
+        cols = np.concatenate(cols) if cols else np.zeros(0, np.int32)
+        values = np.concatenate(values) if values else np.zeros(0, np.float32)
+        order = np.argsort(cols, kind="stable")
+        column_starts = np.searchsorted(cols[order], np.arange(len(vocabulary) + 1)).astype(np.int64)
+        return categories, row_category, vocabulary, idf, rows[order], values[order], column_starts
+    
+    def query(self, text, model):
+        # (term ids, weights) of the normalized TF-IDF vector of a text or MessageAnalysis
+        vocabulary, idf = model[2], model[3]
+        counts = {}
+        for term in self.features(text):
+            term_id = vocabulary.get(term)
+            if term_id is not None:
+                counts[term_id] = counts.get(term_id, 0) + 1
+        term_ids = np.fromiter(counts, np.int64, len(counts))
+        weights = (1 + np.log(np.fromiter(counts.values(), np.float64, len(counts)))) * idf[term_ids]
+        weights /= np.linalg.norm(weights) or 1.0
+        return term_ids, weights
+    
+    def best_rows(self, queries, model):
+        # Best (score, row) per query: a sparse (queries x terms) by (terms x
+        # utterances) product gathered from column slices. Only cells some
+        # query term reaches are summed, so the cost is independent of how
+        # many utterances share no term with the messages.
+        _, row_category, _, _, column_rows, column_values, column_starts = model
+        query_index = np.concatenate([np.full(len(term_ids), i, np.int64)
+                                      for i, (term_ids, _) in enumerate(queries)])
+        term_ids = np.concatenate([term_ids for term_ids, _ in queries])
+        weights = np.concatenate([weights for _, weights in queries])
+        
+        starts = column_starts[term_ids]
+        lengths = column_starts[term_ids + 1] - starts
+        total = int(lengths.sum())
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        rows = column_rows[offsets].astype(np.int64)
+        cells, inverse = np.unique(np.repeat(query_index, lengths) * len(row_category) + rows,
+                                   return_inverse=True)
+        scores = np.bincount(inverse, np.repeat(weights, lengths) * column_values[offsets])
+        
+        # Highest score first within each query, then the first cell per query
+        cell_queries = cells // len(row_category)
+        order = np.lexsort((-scores, cell_queries))
+        first = order[np.r_[True, cell_queries[order][1:] != cell_queries[order][:-1]]] if len(order) else order
+        best = [(0.0, None)] * len(queries)
+        for cell in first:
+            best[cell_queries[cell]] = (float(scores[cell]), int(cells[cell] % len(row_category)))
+        return best
+    
+    def classify(self, text):
+        return self.classify_batch([text])[0]
+    
+    def classify_batch(self, texts):
+        # [(category or None, score)] in input order
+        model = self.model
+        if self.dirty or model is None:
+            with self.lock:
+                model = self.build() if self.dirty or self.model is None else self.model
+        categories, row_category = model[0], model[1]
+        if not categories:
+            return [(None, 0.0)] * len(texts)
+        
+        results = []
+        for start in range(0, len(texts), self.BATCH_SIZE):
+            best = self.best_rows([self.query(text, model) for text in texts[start:start + self.BATCH_SIZE]], model)
+            for score, row in best:
+                if row is not None and score >= self.threshold:
+                    results.append((categories[row_category[row]], score))
+                else:
+                    results.append((None, score))
+        return results
+
+# -------------------- Spell Correction -------------------- #
+class SpellCorrector:
+    # Symmetric-delete (SymSpell-style) corrector over the pattern vocabulary.
+    # Every word is indexed under all strings reachable by deleting up to
+    # max_distance characters; a typo is looked up through its own deletes,
+    # so candidates come from a handful of dict probes instead of comparing
+    # against every word, and only those candidates get a real edit distance.
+    # Corrections (including "no correction") are memoized in an LRU cache.
+    # Only clear non-words are rewritten: known words (installed word lists
+    # and words the user keeps using) are left alone, as are words under
+    # min_length letters. A short word may only be fixed by a transposition
+    # or one added or dropped letter, never a substitution, and a word of
+    # min_length letters only by a transposition or an added letter.
+    TOKEN_RE = re.compile(r"[a-z']+")
+    SHORT_WORD = 4
+    
+    def __init__(self, words=(), max_distance=2, min_length=3, cache_size=4096):
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.frequency = {}
+        self.deletes = {}
+        self.known = set()
+        self.lock = threading.Lock()
+        self.add_words(words)
+    
+    def add_known(self, words):
+        # Real words that must never be "corrected" into vocabulary words
+        with self.lock:
+            size = len(self.known)
+            self.known.update(word.lower() for word in words)
+            if len(self.known) != size:
+                self.cache.clear()
+    
+    def add_words(self, texts):
+        with self.lock:
+            for text in texts:
+                for word in self.TOKEN_RE.findall(text.lower()):
+                    if word not in self.frequency:
+                        self.frequency[word] = 0
+                        for variant in self.variants(word, self.max_distance):
+                            self.deletes.setdefault(variant, []).append(word)
+                    self.frequency[word] += 1
+            self.cache.clear()
+    
+    @staticmethod
+    def variants(word, distance):
+        # word plus every string reachable by deleting up to distance chars
+        found = {word}
+        frontier = [word]
+        for _ in range(distance):
+            next_frontier = []
+            for item in frontier:
+                for index in range(len(item)):
+                    shorter = item[:index] + item[index + 1:]
+                    if shorter not in found:
+                        found.add(shorter)
+                        next_frontier.append(shorter)
+            frontier = next_frontier
+        return found
+    
+    @staticmethod
+    def distance(first, second, limit):
+        # Optimal string alignment distance, or limit + 1 once it is exceeded
+        if abs(len(first) - len(second)) > limit:
+            return limit + 1
+        previous = None
+        row = list(range(len(second) + 1))
+        for i in range(1, len(first) + 1):
+            before, previous, row = previous, row, [i] + [0] * len(second)
+            for j in range(1, len(second) + 1):
+                cost = first[i - 1] != second[j - 1]
+                row[j] = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost)
+                if (i > 1 and j > 1 and first[i - 1] == second[j - 2]
+                        and first[i - 2] == second[j - 1]):
+                    row[j] = min(row[j], before[j - 2] + 1)
+            if min(row) > limit:
+                return limit + 1
+        return row[-1]
+    
+    def lookup(self, word):
+        # Best vocabulary word within the allowed distance, or word itself
+        if word in self.frequency or word in self.known or len(word) < self.min_length:
+            return word
+        
+        with self.lock:
+            cached = self.cache.get(word)
+            if cached is not None:
+                self.cache.move_to_end(word)
+                return cached
+        
+        # Short words get fewer edits, so "helo" may become "hello" but not "hall"
+        limit = min(self.max_distance, max(1, len(word) // 3))
+        best = None
+        seen = set()
+        with self.lock:
+            for variant in self.variants(word, limit):
+                for candidate in self.deletes.get(variant, ()):
+                    if candidate in seen or abs(len(candidate) - len(word)) > limit:
+                        continue
+                    seen.add(candidate)
+                    if len(word) <= self.SHORT_WORD:
+                        if len(candidate) == len(word) and sorted(candidate) != sorted(word):
+                            continue  # A substitution, not a transposition
+                        if len(candidate) < len(word) <= self.min_length:
+                            continue  # Dropping a letter leaves too little to go on
+                    edits = self.distance(word, candidate, limit)
+                    if edits <= limit:
+                        rank = (edits, -self.frequency[candidate], candidate)
+                        if best is None or rank < best:
+                            best = rank
+            
+            result = best[2] if best else word
+            self.cache[word] = result
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+    
+    def correct(self, text):
+        return self.TOKEN_RE.sub(lambda match: self.lookup(match.group()), text)
+    
+    def correct_analysis(self, analysis):
+        # The same analysis when nothing changes, else one of the corrected text
+        tokens = tuple(self.lookup(token) if self.TOKEN_RE.fullmatch(token) else token
+                       for token in analysis.tokens)
+        if tokens == analysis.tokens:
+            return analysis
+        return MessageAnalysis(" ".join(tokens))
+
+# -------------------- Sentiment Service -------------------- #
+class SentimentService:
+    # Classifies text and memoizes results in a size-bounded LRU cache keyed
+    # on normalized text, so repeats like "hi" or "thanks" are analyzed once.
+    def __init__(self, cache_size=1024):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def normalize(self, text):
+        if isinstance(text, MessageAnalysis):
+            return text.normalized
+        return " ".join(text.lower().split())
+    
+    def lookup(self, key):
+        with self.lock:
+            result = self.cache.get(key)
+            if result is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return result
+    
+    def store(self, key, result):
+        with self.lock:
+            self.cache[key] = result
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+    
+    def analyze(self, text):
+        # text may be a string or a MessageAnalysis
+        key = self.normalize(text)
+        result = self.lookup(key)
+        if result is None:
+            result = self.classify(text if isinstance(text, MessageAnalysis) else MessageAnalysis(key))
+            self.store(key, result)
+        return result
+    
+    def analyze_batch(self, texts):
+        # Each distinct normalized text is classified at most once
+        keys = [self.normalize(text) for text in texts]
+        results = {}
+        for text, key in zip(texts, keys):
+            if key not in results:
+                result = self.lookup(key)
+                if result is None:
+                    result = self.classify(text if isinstance(text, MessageAnalysis) else MessageAnalysis(key))
+                    self.store(key, result)
+                results[key] = result
+        return [results[key] for key in keys]
+    
+    def get_stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.cache),
+                "capacity": self.cache_size,
+                "hit_rate": f"{(self.hits / total * 100) if total else 0:.1f}%"
+            }
+    
+    def classify(self, analysis):
+        if SENTIMENT_ANALYSIS and load_textblob() is not None:
+            try:
+                polarity = TextBlob(analysis.normalized).sentiment.polarity
+                
+                if polarity > 0.3:
+                    return "positive", "😊", polarity
+                elif polarity < -0.3:
+                    return "negative", "😔", polarity
+                else:
+                    return "neutral", "😐", polarity
+            except:
+                return "neutral", "😐", 0
+        else:
+            # Simple keyword-based fallback
+            positive_words = ["good", "great", "love", "happy", "excellent", "awesome", "wonderful"]
+            negative_words = ["bad", "sad", "hate", "angry", "terrible", "awful", "upset"]
+            
+            pos_count = sum(1 for word in positive_words if word in analysis.token_set)
+            neg_count = sum(1 for word in negative_words if word in analysis.token_set)
+            
+            if pos_count > neg_count:
+                return "positive", "😊", 0.5
+            elif neg_count > pos_count:
+                return "negative", "😔", -0.5
+            else:
+                return "neutral", "😐", 0
 
 # -------------------- Enhanced Response Engine -------------------- #
 class ResponseEngine:
-    def __init__(self):
-        self.responses = self.load_responses()
+    def __init__(self, sentiment=None, classifier="matcher", threshold=0.3, typo_distance=2, typo_cache_size=4096):
+        self.sentiment = sentiment if sentiment is not None else SentimentService()
+        
+        # "tfidf" scores whole words against patterns and examples; without
+        # NumPy the substring matcher is used instead
+        self.use_classifier = classifier == "tfidf" and load_numpy() is not None
+        self.threshold = threshold
+        self.typo_distance = typo_distance
+        self.typo_cache_size = typo_cache_size
         self.fallback_responses = [
             "That's interesting! Tell me more about it.",
             "I'm not sure I understand. Could you rephrase that?",
@@ -187,10 +2327,55 @@ class ResponseEngine:
             "Thanks for sharing! How's your day going?"
         ]
         
+        # The response table and its matcher are built on first use
+        self.response_table = None
+        self.intent_matcher = None
+        self.intent_classifier = None
+        self.spell_corrector = None
+        self.load_lock = threading.Lock()
+    
+    def ensure_loaded(self):
+        if self.response_table is not None:
+            return
+        
+        with self.load_lock:
+            if self.response_table is None:
+                table = self.load_responses()
+                self.intent_matcher = IntentMatcher(table)
+                if self.use_classifier:
+                    self.intent_classifier = IntentClassifier(table, self.threshold)
+                if self.typo_distance > 0:
+                    self.spell_corrector = SpellCorrector(
+                        (text for data in table.values() for text in data["patterns"] + data.get("examples", [])),
+                        self.typo_distance, cache_size=self.typo_cache_size)
+                    self.spell_corrector.add_known(load_known_words())
+                self.response_table = table
+    
+    @property
+    def responses(self):
+        self.ensure_loaded()
+        return self.response_table
+    
+    @property
+    def matcher(self):
+        self.ensure_loaded()
+        return self.intent_matcher
+    
+    @property
+    def classifier(self):
+        self.ensure_loaded()
+        return self.intent_classifier
+    
+    @property
+    def corrector(self):
+        self.ensure_loaded()
+        return self.spell_corrector
+        
     def load_responses(self):
         responses = {
             "greetings": {
                 "patterns": ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"],
+                "examples": ["hi there", "hello chatbuddy", "hey there friend", "greetings"],
                 "responses": [
                     "Hello! 😊 How can I assist you today?",
                     "Hi there! 👋 Nice to see you!",
@@ -199,6 +2384,7 @@ class ResponseEngine:
             },
             "farewell": {
                 "patterns": ["bye", "goodbye", "see you", "take care"],
+                "examples": ["see you later", "talk to you tomorrow", "i have to go now", "good night"],
                 "responses": [
                     "Goodbye! 👋 Have a wonderful day!",
                     "See you soon! 😊",
@@ -207,6 +2393,7 @@ class ResponseEngine:
             },
             "gratitude": {
                 "patterns": ["thanks", "thank you", "appreciate"],
+                "examples": ["thanks a lot", "i appreciate your help", "that was helpful", "cheers"],
                 "responses": [
                     "You're welcome! 😇",
                     "My pleasure! 😊",
@@ -215,6 +2402,7 @@ class ResponseEngine:
             },
             "identity": {
                 "patterns": ["who are you", "what is your name", "what are you"],
+                "examples": ["are you a bot", "are you human", "tell me about yourself", "who made you"],
                 "responses": [
                     "I'm ChatBuddy Pro, your AI assistant! 🤖",
                     "I'm your friendly chatbot, here to help and chat! 😄"
@@ -222,6 +2410,7 @@ class ResponseEngine:
             },
             "mood": {
                 "patterns": ["how are you", "how do you feel", "how's it going"],
+                "examples": ["how are you doing today", "how have you been", "are you okay", "what's up"],
                 "responses": [
                     "I'm doing great, thanks for asking! Ready to help! 😊",
                     "All systems go! How about you?",
@@ -230,6 +2419,7 @@ class ResponseEngine:
             },
             "joke": {
                 "patterns": ["joke", "funny", "make me laugh"],
+                "examples": ["tell me a joke", "say something hilarious", "i need a laugh", "cheer me up with humor"],
                 "responses": [
                     "Why don't scientists trust atoms? Because they make up everything! 😂",
                     "Why did the scarecrow win an award? He was outstanding in his field! 🌾",
@@ -238,6 +2428,7 @@ class ResponseEngine:
             },
             "help": {
                 "patterns": ["help", "what can you do", "features"],
+                "examples": ["how do i use this", "what are your features", "show me the commands", "i need assistance"],
                 "responses": [
                     "I can chat with you, tell jokes, analyze sentiment, remember our conversation, and much more! Try saying 'tell me a joke' or 'analyze my mood'! 🎯",
                     "I'm here to chat, help, and entertain! You can ask me about anything, or try our special features like file attachments or sentiment analysis! ✨"
@@ -245,6 +2436,7 @@ class ResponseEngine:
             },
             "time": {
                 "patterns": ["time", "what time", "current time"],
+                "examples": ["what time is it", "tell me the time", "what's the time now", "what hour is it"],
                 "responses": [
                     f"The current time is {datetime.now().strftime('%H:%M:%S')} ⏰",
                     f"According to my clock, it's {datetime.now().strftime('%I:%M %p')} 🕐"
@@ -253,101 +2445,1198 @@ class ResponseEngine:
         }
         return responses
     
-    def get_response(self, user_msg, context=None, sentiment=None):
-        user_msg_lower = user_msg.lower()
+    def add_category(self, category, patterns, responses, priority=None, examples=()):
+        if category in self.responses:
+            self.responses[category]["patterns"].extend(patterns)
+            self.responses[category]["responses"].extend(responses)
+            self.responses[category].setdefault("examples", []).extend(examples)
+        else:
+            self.responses[category] = {"patterns": list(patterns), "responses": list(responses),
+                                        "examples": list(examples)}
+        
+        # Only the new patterns are inserted; failure links and the TF-IDF
+        # matrix are refreshed lazily
+        self.matcher.add_category(category, patterns, priority)
+        if self.classifier is not None:
+            self.classifier.add_category(category, list(patterns) + list(examples))
+        if self.corrector is not None:
+            self.corrector.add_words(list(patterns) + list(examples))
+    
+    def get_response(self, user_msg, context=None, sentiment=None):
+        analysis = MessageAnalysis.of(user_msg)
+        category = self.match_category(analysis)
+        return self.compose_response(analysis, category, context, sentiment)
+    
+    def match_category(self, user_msg):
+        return self.match_categories([user_msg])[0]
+    
+    def match_categories(self, user_msgs):
+        # Strings or MessageAnalysis records; typos are corrected first
+        analyses = [MessageAnalysis.of(user_msg) for user_msg in user_msgs]
+        if self.corrector is not None:
+            analyses = [self.corrector.correct_analysis(analysis) for analysis in analyses]
+        # The classifier scores the whole list in one matrix product
+        if self.classifier is not None:
+            return [category for category, _ in self.classifier.classify_batch(analyses)]
+        # Single pass over each message for every known pattern
+        return [self.matcher.best_match(analysis.normalized) for analysis in analyses]
+    
+    def compose_response(self, user_msg, category, context=None, sentiment=None):
+        analysis = MessageAnalysis.of(user_msg)
+        if category is not None:
+            response = random.choice(self.responses[category]["responses"])
+            
+            # Add context awareness
+            if context and len(context) > 0:
+                previous = context[-1]
+                last_topic = (previous.analyzed() if isinstance(previous, Exchange)
+                              else MessageAnalysis(previous.get("user", "")))
+                if last_topic.has_phrase("how are") and "fine" in analysis.token_set:
+                    response = "Glad to hear you're doing well! 😊 " + response
+            
+            # Adjust based on sentiment
+            if sentiment:
+                if sentiment == "positive":
+                    response = "That's wonderful! 😊 " + response
+                elif sentiment == "negative":
+                    response = "I'm here for you. ❤️ " + response
+            
+            return response
+        
+        # If no match, use contextual or fallback response
+        if context and len(context) > 0:
+            last_exchange = context[-1]
+            last_bot_msg = last_exchange.get("bot", "").lower()
+            
+            if "how are" in last_bot_msg:
+                if analysis.token_set & {"good", "great", "fine", "well"} and not analysis.has_phrase("not good"):
+                    return "I'm glad to hear that! 😊 What would you like to talk about?"
+                elif analysis.token_set & {"bad", "sad", "tired"} or analysis.has_phrase("not good"):
+                    return "I'm sorry to hear that. I'm here to chat if you want to talk about it. ❤️"
+        
+        return random.choice(self.fallback_responses)
+    
+    def analyze_sentiment(self, text):
+        return self.sentiment.analyze(text)
+
+# -------------------- Autocomplete -------------------- #
+class TrieNode:
+    __slots__ = ("children", "top", "bucket")
+    
+    def __init__(self):
+        self.children = {}
+        self.top = []        # Phrase ids of the best completions, best first
+        self.bucket = None   # At max_depth: every phrase id below this node
+
+class CompletionTrie:
+    # Prefix trie of phrases. Every node caches its top_k completions, so a
+    # lookup is a walk down the prefix and never visits the subtree. Scores
+    # mix frequency and recency: each use adds growth ** tick, so a use
+    # counts double against one half_life uses older, without ever
+    # rescoring old phrases. Since a use only raises one phrase's score,
+    # the caches on its path are all that can change.
+    # Nodes stop at max_depth to bound memory; longer prefixes filter the
+    # bucket of phrases kept at that depth.
+    def __init__(self, top_k=4, half_life=200, max_depth=12, max_length=100):
+        self.top_k = top_k
+        self.growth = 2 ** (1 / half_life)
+        self.max_depth = max_depth
+        self.max_length = max_length
+        self.root = TrieNode()
+        self.ids = {}
+        self.phrases = []
+        self.scores = []
+        self.boost = 1.0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.lower().split())
+    
+    def add(self, phrase, weight=1.0):
+        phrase = self.normalize(phrase)
+        if not phrase or len(phrase) > self.max_length:
+            return
+        
+        with self.lock:
+            self.boost *= self.growth
+            if self.boost > 1e100:
+                # Rescale everything; relative order (and every cache) is unchanged
+                self.scores = [score / self.boost for score in self.scores]
+                self.boost = 1.0
+            
+            phrase_id = self.ids.get(phrase)
+            if phrase_id is None:
+                phrase_id = self.ids[phrase] = len(self.phrases)
+                self.phrases.append(phrase)
+                self.scores.append(0.0)
+                new = True
+            else:
+                new = False
+            self.scores[phrase_id] += weight * self.boost
+            
+            node = self.root
+            for depth, char in enumerate(phrase[:self.max_depth], 1):
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = TrieNode()
+                node = child
+                self.rank(node.top, phrase_id)
+                if depth == self.max_depth and new and len(phrase) > depth:
+                    if node.bucket is None:
+                        node.bucket = []
+                    node.bucket.append(phrase_id)
+    
+    def rank(self, top, phrase_id):
+        scores = self.scores
+        if phrase_id not in top:
+            if len(top) < self.top_k:
+                top.append(phrase_id)
+            elif scores[phrase_id] > scores[top[-1]]:
+                top[-1] = phrase_id
+            else:
+                return
+        top.sort(key=scores.__getitem__, reverse=True)
+    
+    def complete(self, text, limit=None):
+        # Completions for what the user has typed so far, best first
+        prefix = self.normalize(text)
+        if not prefix:
+            return []
+        if text[-1:].isspace():
+            prefix += " "
+        limit = limit or self.top_k
+        
+        with self.lock:
+            node = self.root
+            for char in prefix[:self.max_depth]:
+                node = node.children.get(char)
+                if node is None:
+                    return []
+            if len(prefix) <= self.max_depth:
+                ids = node.top[:limit]
+            else:
+                matches = [phrase_id for phrase_id in node.bucket or ()
+                           if self.phrases[phrase_id].startswith(prefix)]
+                ids = heapq.nlargest(limit, matches, key=self.scores.__getitem__)
+            return [self.phrases[phrase_id] for phrase_id in ids]
+    
+    def __len__(self):
+        return len(self.phrases)
+
+# -------------------- Session Registry -------------------- #
+class SessionShard:
+    __slots__ = ("lock", "entries", "loading", "stats")
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # session_id -> [state, last_used], least recent first
+        self.loading = {}  # session_id -> Event set once its miss is resolved
+        self.stats = {"created": 0, "restored": 0, "evicted": 0, "expired": 0}
+
+class SessionRegistry:
+    # Live conversations keyed by session id. Sessions hash onto shards that
+    # each have their own lock and LRU order, so threads serving different
+    # sessions rarely contend. A shard evicts its least recently used
+    # session once over its share of capacity, and expires sessions idle for
+    # longer than ttl whenever it is touched (sweep() does all shards). With
+    # snapshot_dir set, evicted sessions are written there as JSON and are
+    # restored transparently when their id comes back. Pinned sessions (the
+    # window's own) are never evicted.
+    def __init__(self, factory, capacity=50000, ttl=1800, shards=16, snapshot_dir=None):
+        self.factory = factory  # session_id -> (memory, session)
+        self.shards = [SessionShard() for _ in range(max(1, shards))]
+        self.shard_capacity = max(1, capacity // len(self.shards))
+        self.ttl = ttl
+        self.snapshot_dir = snapshot_dir
+        self.pinned = {}
+        self.snapshot_stats = {"written": 0, "errors": 0}
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+    
+    def shard(self, session_id):
+        return self.shards[hash(session_id) % len(self.shards)]
+    
+    def get(self, session_id, create=True):
+        state = self.pinned.get(session_id)
+        if state is not None:
+            return state
+        
+        shard = self.shard(session_id)
+        while True:
+            now = time.monotonic()
+            with shard.lock:
+                entry = shard.entries.get(session_id)
+                if entry is not None:
+                    entry[1] = now
+                    shard.entries.move_to_end(session_id)
+                    return entry[0]
+                
+                # One thread resolves a miss; the others wait for it and look
+                # again, so a thread that finds the snapshot already taken
+                # never builds a fresh session over the restored one
+                loading = shard.loading.get(session_id)
+                if loading is None:
+                    loading = shard.loading[session_id] = threading.Event()
+                    break
+            loading.wait()
+        
+        # Miss: build or restore outside the lock
+        try:
+            state = self.load_snapshot(session_id)
+            restored = state is not None
+            if state is None:
+                if not create:
+                    return None
+                state = self.factory(session_id)
+            return self.insert(shard, session_id, state, now, "restored" if restored else "created")
+        finally:
+            with shard.lock:
+                del shard.loading[session_id]
+            loading.set()
+    
+    def put(self, session_id, state, pinned=False):
+        if pinned:
+            self.pinned[session_id] = state
+            return state
+        return self.insert(self.shard(session_id), session_id, state, time.monotonic(), "created", replace=True)
+    
+    def insert(self, shard, session_id, state, now, counter, replace=False):
+        with shard.lock:
+            entry = shard.entries.get(session_id)
+            if entry is None or replace:
+                shard.entries[session_id] = [state, now]
+                shard.entries.move_to_end(session_id)
+                if entry is None:
+                    shard.stats[counter] += 1
+            else:
+                state = entry[0]  # Another thread got there first
+                entry[1] = now
+                shard.entries.move_to_end(session_id)
+            evicted = self.evict(shard, now)
+        self.snapshot(evicted)
+        return state
+    
+    def evict(self, shard, now):
+        # Caller holds the lock; expired sessions first, then LRU over capacity
+        evicted = []
+        entries = shard.entries
+        while entries:
+            session_id, (state, last_used) = next(iter(entries.items()))
+            if now - last_used > self.ttl:
+                shard.stats["expired"] += 1
+            elif len(entries) > self.shard_capacity:
+                shard.stats["evicted"] += 1
+            else:
+                break
+            del entries[session_id]
+            evicted.append((session_id, state))
+        return evicted
+    
+    def pop(self, session_id):
+        state = self.pinned.pop(session_id, None)
+        if state is not None:
+            return state
+        shard = self.shard(session_id)
+        with shard.lock:
+            entry = shard.entries.pop(session_id, None)
+        return entry[0] if entry else None
+    
+    def sweep(self):
+        # Expire idle sessions in every shard; returns how many were dropped
+        now = time.monotonic()
+        count = 0
+        for shard in self.shards:
+            with shard.lock:
+                evicted = self.evict(shard, now)
+            self.snapshot(evicted)
+            count += len(evicted)
+        return count
+    
+    def snapshot_path(self, session_id):
+        name = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.snapshot_dir, f"{name}.json")
+    
+    def snapshot(self, evicted):
+        if not self.snapshot_dir:
+            return
+        for session_id, (memory, session) in evicted:
+            path = self.snapshot_path(session_id)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"session_id": session_id, "session": session.get_state(),
+                               "memory": memory.get_state()}, f, default=record_to_json)
+                os.replace(tmp_path, path)
+                self.snapshot_stats["written"] += 1
+            except (OSError, TypeError, ValueError):
+                self.snapshot_stats["errors"] += 1
+    
+    def load_snapshot(self, session_id):
+        if not self.snapshot_dir:
+            return None
+        path = self.snapshot_path(session_id)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("session_id") != session_id:
+            return None
+        
+        memory, session = self.factory(session_id)
+        memory.set_state(data.get("memory", {}))
+        session.set_state(data.get("session", {}))
+        try:
+            os.remove(path)  # Live again; a later eviction writes a fresh snapshot
+        except OSError:
+            pass
+        return memory, session
+    
+    def __len__(self):
+        return len(self.pinned) + sum(len(shard.entries) for shard in self.shards)
+    
+    def __contains__(self, session_id):
+        if session_id in self.pinned:
+            return True
+        shard = self.shard(session_id)
+        with shard.lock:
+            return session_id in shard.entries
+    
+    def get_stats(self):
+        stats = {"live": len(self), "pinned": len(self.pinned), "shards": len(self.shards)}
+        for shard in self.shards:
+            for key, value in shard.stats.items():
+                stats[key] = stats.get(key, 0) + value
+        stats["snapshots"] = self.snapshot_stats["written"]
+        stats["snapshot_errors"] = self.snapshot_stats["errors"]
+        return stats
+
+# -------------------- Conversation Core -------------------- #
+class ConversationCore:
+    # GUI-independent send -> sentiment -> context -> respond -> remember
+    # pipeline. One engine is shared by every session it serves.
+    def __init__(self, engine=None, max_memory=10, capacity=50000, ttl=1800, shards=16, snapshot_dir=None):
+        self.engine = engine if engine is not None else ResponseEngine()
+        self.max_memory = max_memory
+        self.sessions = SessionRegistry(self.new_session, capacity, ttl, shards, snapshot_dir)
+    
+    def new_session(self, session_id):
+        session = SessionManager()
+        session.session_id = session_id
+        return ConversationMemory(self.max_memory), session
+    
+    def open_session(self, session_id=None, memory=None, session=None):
+        # Sessions opened with their own memory/session objects belong to a
+        # caller that holds on to them (the window), so they are pinned
+        pinned = memory is not None or session is not None
+        if session is None:
+            session = SessionManager()
+            if session_id is not None:
+                session.session_id = session_id
+        if session_id is None:
+            session_id = session.session_id
+        memory = memory if memory is not None else ConversationMemory(self.max_memory)
+        
+        self.sessions.put(session_id, (memory, session), pinned)
+        return session_id
+    
+    def get_session(self, session_id):
+        return self.sessions.get(session_id)
+    
+    def close_session(self, session_id):
+        return self.sessions.pop(session_id)
+    
+    def reply(self, session_id, user_msg):
+        return self.reply_batch([(session_id, user_msg)])[0]
+    
+    def record_delivery(self, session_id):
+        # Counts a reply from reply_batch once it has reached the user
+        memory, session = self.get_session(session_id)
+        session.message_count += 1
+        session.bot_messages += 1
+    
+    def reply_batch(self, requests):
+        # Messages may be strings or a MessageAnalysis the caller already
+        # holds. Analysis, sentiment and intent matching run once per distinct
+        # text in the batch; messages are then applied in order so each
+        # session still sees its own context.
+        analyses = {}
+        for _, user_msg in requests:
+            text = user_msg.text if isinstance(user_msg, MessageAnalysis) else user_msg
+            if text not in analyses:
+                analyses[text] = MessageAnalysis.of(user_msg)
+        distinct = list(analyses.values())
+        sentiments = dict(zip(analyses, self.engine.sentiment.analyze_batch(distinct)))
+        categories = dict(zip(analyses, self.engine.match_categories(distinct)))
+        
+        replies = []
+        for session_id, user_msg in requests:
+            memory, session = self.get_session(session_id)
+            user_msg = user_msg.text if isinstance(user_msg, MessageAnalysis) else user_msg
+            analysis = analyses[user_msg]
+            sentiment, emoji, score = sentiments[user_msg]
+            
+            context = memory.get_context()
+            # Responses come from a finite table, so interning shares them
+            # across every session's memory
+            response = sys.intern(self.engine.compose_response(analysis, categories[user_msg], context, sentiment))
+            memory.add_exchange(user_msg, response, analysis)
+            session.sentiment.update(score)
+            
+            # The bot side is counted by record_delivery once the reply is
+            # actually delivered; a cancelled reply never reaches the user
+            session.message_count += 1
+            session.user_messages += 1
+            
+            # Add sentiment emoji if not neutral
+            if sentiment != "neutral":
+                display = f"{emoji} {response}"
+            else:
+                display = response
+            
+            replies.append({
+                "session_id": session_id,
+                "user_msg": user_msg,
+                "response": response,
+                "display": display,
+                "sentiment": sentiment,
+                "emoji": emoji,
+                "score": score
+            })
+        return replies
+
+# -------------------- Reply Scheduler -------------------- #
+class ReplyScheduler:
+    # Min-heap of pending replies. Nothing sleeps per message: the Tk app
+    # drains it from root.after, headless deployments await serve().
+    # Due times never go backwards, so replies are delivered in order.
+    def __init__(self, delay=0.8, jitter=0.5):
+        self.delay = delay
+        self.jitter = jitter
+        self.heap = []
+        self.cancelled = set()
+        self.counter = itertools.count()
+        self.last_due = 0.0
+        self.lock = threading.Lock()
+        self.loop = None
+        self.wakeup = None
+    
+    def next_delay(self):
+        return self.delay + (random.random() * self.jitter if self.jitter else 0)
+    
+    def schedule(self, callback, *args, delay=None):
+        if delay is None:
+            delay = self.next_delay()
+        
+        with self.lock:
+            due = max(time.monotonic() + delay, self.last_due)
+            self.last_due = due
+            handle = next(self.counter)
+            heapq.heappush(self.heap, (due, handle, callback, args))
+        
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        return handle
+    
+    def cancel(self, handle):
+        with self.lock:
+            self.cancelled.add(handle)
+    
+    def cancel_all(self):
+        with self.lock:
+            count = len(self.heap)
+            self.heap.clear()
+            self.cancelled.clear()
+        return count
+    
+    def pending(self):
+        with self.lock:
+            return len(self.heap) - len(self.cancelled)
+    
+    def pop_due(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                _, handle, callback, args = heapq.heappop(self.heap)
+                if handle in self.cancelled:
+                    self.cancelled.discard(handle)
+                    continue
+                due.append((callback, args))
+        return due
+    
+    def time_until_next(self):
+        with self.lock:
+            if not self.heap:
+                return None
+            return max(0.0, self.heap[0][0] - time.monotonic())
+    
+    async def serve(self):
+        # Headless driver: runs due callbacks on the event loop
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        try:
+            while True:
+                for callback, args in self.pop_due():
+                    callback(*args)
+                
+                self.wakeup.clear()
+                timeout = self.time_until_next()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.loop = None
+
+# -------------------- Notification Service -------------------- #
+class NotificationService:
+    # Delivers desktop notifications on its own thread so a slow backend
+    # never blocks the UI. Notifications arriving within merge_window of the
+    # first one in a burst collapse into a single "N new messages" per title.
+    # A token bucket (rate per second, up to burst) limits what reaches the
+    # desktop; anything over the limit is dropped and counted.
+    def __init__(self, send, merge_window=2.0, rate=0.2, burst=2):
+        self.send = send
+        self.merge_window = merge_window
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.refilled = time.monotonic()
+        self.requests = queue.Queue()
+        # Counted from both the UI thread (notify) and the notifier thread
+        self.stats = {"queued": 0, "merged": 0, "delivered": 0, "dropped": 0, "suppressed": 0, "errors": 0}
+        self.stats_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def notify(self, title, message, focused=False):
+        # Nothing is shown while the user is already looking at the window
+        if focused:
+            self.count("suppressed")
+            return
+        self.count("queued")
+        self.requests.put((title, message))
+    
+    def run(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                break
+            
+            batch = [item]
+            closing = False
+            deadline = time.monotonic() + self.merge_window
+            while True:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            
+            self.deliver(batch)
+            if closing:
+                break
+    
+    def deliver(self, batch):
+        merged = OrderedDict()
+        for title, message in batch:
+            merged.setdefault(title, []).append(message)
+        
+        for title, messages in merged.items():
+            self.count("merged", len(messages) - 1)
+            if not self.take_token():
+                self.count("dropped", len(messages))
+                continue
+            message = messages[0] if len(messages) == 1 else f"{len(messages)} new messages"
+            try:
+                self.send(title, message)
+                self.count("delivered")
+            except Exception:
+                self.count("errors")
+    
+    def count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+    
+    def take_token(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+    
+    def get_stats(self):
+        with self.stats_lock:
+            return dict(self.stats)
+    
+    def close(self, timeout=1):
+        # Whatever is still queued is delivered (or dropped) before exit
+        self.requests.put(None)
+        self.thread.join(timeout)
+
+# -------------------- Session File Format -------------------- #
+# Layout: MAGIC, version byte, flags byte, then a record stream (zlib
+# compressed when FLAG_ZLIB is set). Each record is a type byte, a varint
+# payload length and the payload. Sender and type values are written once
+# as STRING records and referenced by index; message timestamps are stored
+# as integer microseconds when they round-trip exactly.
+SESSION_MAGIC = b"CBSESS"
+SESSION_VERSION = 1
+SESSION_FLAG_ZLIB = 1
+
+REC_END = 0
+REC_STRING = 1
+REC_META = 2
+REC_MEMORY = 3
+REC_MESSAGE = 4
+
+MSG_HAS_SENDER = 1
+MSG_HAS_TYPE = 2
+MSG_TIME_MICROS = 4
+MSG_TIME_TEXT = 8
+MSG_HAS_TEXT = 16
+MSG_HAS_EXTRA = 32
+
+def pack_varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def unpack_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def pack_bytes(data):
+    return pack_varint(len(data)) + data
+
+class SessionWriter:
+    def __init__(self, compress=True):
+        self.compress = compress
+        self.strings = {}
+        self.records = []
+    
+    def record(self, rec_type, payload):
+        self.records.append(bytes([rec_type]) + pack_bytes(payload))
+    
+    def header(self):
+        flags = SESSION_FLAG_ZLIB if self.compress else 0
+        return SESSION_MAGIC + bytes([SESSION_VERSION, flags])
+    
+    def take(self, end=False):
+        # Encoded records so far (plus the end marker), removed from the writer
+        if end:
+            self.record(REC_END, b"")
+        data = b"".join(self.records)
+        self.records.clear()
+        return data
+    
+    def string_ref(self, value):
+        ref = self.strings.get(value)
+        if ref is None:
+            ref = self.strings[value] = len(self.strings)
+            self.record(REC_STRING, value.encode("utf-8"))
+        return ref
+    
+    def add_meta(self, meta):
+        self.record(REC_META, json.dumps(meta, default=str).encode("utf-8"))
+    
+    def add_memory(self, exchange):
+        self.record(REC_MEMORY, json.dumps(exchange, default=record_to_json).encode("utf-8"))
+    
+    def add_message(self, msg):
+        flags = 0
+        parts = []
+        
+        sender = msg.get("sender")
+        if isinstance(sender, str):
+            flags |= MSG_HAS_SENDER
+            parts.append(pack_varint(self.string_ref(sender)))
+        msg_type = msg.get("type")
+        if isinstance(msg_type, str):
+            flags |= MSG_HAS_TYPE
+            parts.append(pack_varint(self.string_ref(msg_type)))
+        
+        timestamp = msg.timestamp if isinstance(msg, Message) else msg.get("timestamp")
+        if isinstance(timestamp, float):
+            flags |= MSG_TIME_MICROS
+            parts.append(struct.pack("<q", round(timestamp * 1_000_000)))
+        elif isinstance(timestamp, str):
+            micros = None
+            try:
+                dt = datetime.fromisoformat(timestamp)
+                if dt.tzinfo is None:
+                    micros = (dt - EPOCH) // timedelta(microseconds=1)
+                    if (EPOCH + timedelta(microseconds=micros)).isoformat() != timestamp:
+                        micros = None
+            except ValueError:
+                pass
+            if micros is not None:
+                flags |= MSG_TIME_MICROS
+                parts.append(struct.pack("<q", micros))
+            else:
+                flags |= MSG_TIME_TEXT
+                parts.append(pack_bytes(timestamp.encode("utf-8")))
+        
+        text = msg.get("message")
+        if isinstance(text, str):
+            flags |= MSG_HAS_TEXT
+            parts.append(pack_bytes(text.encode("utf-8")))
+        
+        extra = {k: v for k, v in msg.items() if k not in ("sender", "type", "timestamp", "message")
+                 or not isinstance(v, str)}
+        if extra:
+            flags |= MSG_HAS_EXTRA
+            parts.append(pack_bytes(json.dumps(extra).encode("utf-8")))
+        
+        self.record(REC_MESSAGE, bytes([flags]) + b"".join(parts))
+    
+    def getvalue(self):
+        body = self.take(end=True)
+        if self.compress:
+            body = zlib.compress(body)
+        return self.header() + body
+
+def encode_session(session_data, compress=True):
+    return b"".join(iter_session(session_data, compress))
+
+def iter_session(session_data, compress=True, batch=1024):
+    # Yields the encoded file in chunks; "messages" may be any iterable, so a
+    # spilled session buffer is written without materializing it
+    writer = SessionWriter(compress)
+    compressor = zlib.compressobj() if compress else None
+    yield writer.header()
+    
+    writer.add_meta({"session": session_data.get("session", {}),
+                     "config": session_data.get("config", {}),
+                     "topics": session_data.get("topics", {}),
+                     "sentiment": session_data.get("sentiment")})
+    for exchange in session_data.get("memory", []):
+        writer.add_memory(exchange)
+    for count, msg in enumerate(session_data.get("messages", []), 1):
+        writer.add_message(msg)
+        if count % batch == 0:
+            data = writer.take()
+            yield compressor.compress(data) if compressor else data
+    
+    data = writer.take(end=True)
+    yield compressor.compress(data) + compressor.flush() if compressor else data
+
+class SessionReader:
+    # Streams records from an open binary file; iterating yields
+    # ("meta" | "memory" | "message", value) as soon as each record is read.
+    CHUNK_SIZE = 64 * 1024
+    
+    def __init__(self, f):
+        self.f = f
+        header = f.read(len(SESSION_MAGIC) + 2)
+        if header[:len(SESSION_MAGIC)] != SESSION_MAGIC:
+            raise ValueError("Not a ChatBuddy session file")
+        version, flags = header[len(SESSION_MAGIC)], header[len(SESSION_MAGIC) + 1]
+        if version > SESSION_VERSION:
+            raise ValueError(f"Session format version {version} is newer than supported")
         
-        # Check for exact matches first
-        for category, data in self.responses.items():
-            for pattern in data["patterns"]:
-                if pattern in user_msg_lower:
-                    response = random.choice(data["responses"])
-                    
-                    # Add context awareness
-                    if context and len(context) > 0:
-                        last_topic = context[-1].get("user", "").lower()
-                        if "how are" in last_topic and "fine" in user_msg_lower:
-                            response = "Glad to hear you're doing well! 😊 " + response
-                    
-                    # Adjust based on sentiment
-                    if sentiment:
-                        if sentiment == "positive":
-                            response = "That's wonderful! 😊 " + response
-                        elif sentiment == "negative":
-                            response = "I'm here for you. ❤️ " + response
-                    
-                    return response
+        self.decompressor = zlib.decompressobj() if flags & SESSION_FLAG_ZLIB else None
+        self.buffer = b""
+        self.pos = 0
+        self.eof = False
+        self.strings = []
+    
+    @staticmethod
+    def is_session_file(f):
+        start = f.tell()
+        magic = f.read(len(SESSION_MAGIC))
+        f.seek(start)
+        return magic == SESSION_MAGIC
+    
+    def fill(self, size):
+        while len(self.buffer) - self.pos < size and not self.eof:
+            chunk = self.f.read(self.CHUNK_SIZE)
+            if not chunk:
+                self.eof = True
+                if self.decompressor is not None:
+                    chunk = self.decompressor.flush()
+            elif self.decompressor is not None:
+                chunk = self.decompressor.decompress(chunk)
+            self.buffer = self.buffer[self.pos:] + chunk
+            self.pos = 0
+        if len(self.buffer) - self.pos < size:
+            raise ValueError("Session file is truncated")
+    
+    def read_record(self):
+        self.fill(1)
+        rec_type = self.buffer[self.pos]
+        self.pos += 1
         
-        # If no match, use contextual or fallback response
-        if context and len(context) > 0:
-            last_exchange = context[-1]
-            last_bot_msg = last_exchange.get("bot", "").lower()
-            
-            if "how are" in last_bot_msg:
-                if any(word in user_msg_lower for word in ["good", "great", "fine", "well"]):
-                    return "I'm glad to hear that! 😊 What would you like to talk about?"
-                elif any(word in user_msg_lower for word in ["bad", "sad", "not good", "tired"]):
-                    return "I'm sorry to hear that. I'm here to chat if you want to talk about it. ❤️"
+        # Varints are at most 10 bytes; fill what is available
+        try:
+            self.fill(10)
+        except ValueError:
+            pass
+        try:
+            length, self.pos = unpack_varint(self.buffer, self.pos)
+        except IndexError:
+            raise ValueError("Session file is truncated") from None
+        self.fill(length)
+        payload = self.buffer[self.pos:self.pos + length]
+        self.pos += length
+        return rec_type, payload
+    
+    def decode_message(self, payload):
+        flags = payload[0]
+        pos = 1
+        msg = Message()
         
-        return random.choice(self.fallback_responses)
+        if flags & MSG_HAS_SENDER:
+            ref, pos = unpack_varint(payload, pos)
+            msg.sender = self.strings[ref]
+        if flags & MSG_HAS_TYPE:
+            ref, pos = unpack_varint(payload, pos)
+            msg.type = self.strings[ref]
+        if flags & MSG_TIME_MICROS:
+            micros = struct.unpack_from("<q", payload, pos)[0]
+            pos += 8
+            msg.timestamp = micros / 1_000_000
+        elif flags & MSG_TIME_TEXT:
+            length, pos = unpack_varint(payload, pos)
+            msg.timestamp = payload[pos:pos + length].decode("utf-8")
+            pos += length
+        if flags & MSG_HAS_TEXT:
+            length, pos = unpack_varint(payload, pos)
+            msg.message = payload[pos:pos + length].decode("utf-8")
+            pos += length
+        if flags & MSG_HAS_EXTRA:
+            length, pos = unpack_varint(payload, pos)
+            extra = json.loads(payload[pos:pos + length].decode("utf-8"))
+            # Non-string core fields travel in the extra blob
+            for key in Message.FIELDS:
+                if key in extra:
+                    setattr(msg, key, extra.pop(key))
+            msg.extra = extra or None
+        return msg
     
-    def analyze_sentiment(self, text):
-        if SENTIMENT_ANALYSIS:
-            try:
-                analysis = TextBlob(text)
-                polarity = analysis.sentiment.polarity
-                
-                if polarity > 0.3:
-                    return "positive", "😊", polarity
-                elif polarity < -0.3:
-                    return "negative", "😔", polarity
-                else:
-                    return "neutral", "😐", polarity
-            except:
-                return "neutral", "😐", 0
-        else:
-            # Simple keyword-based fallback
-            positive_words = ["good", "great", "love", "happy", "excellent", "awesome", "wonderful"]
-            negative_words = ["bad", "sad", "hate", "angry", "terrible", "awful", "upset"]
-            
-            text_lower = text.lower()
-            pos_count = sum(1 for word in positive_words if word in text_lower)
-            neg_count = sum(1 for word in negative_words if word in text_lower)
-            
-            if pos_count > neg_count:
-                return "positive", "😊", 0.5
-            elif neg_count > pos_count:
-                return "negative", "😔", -0.5
+    def check_end(self):
+        # A compressed body must run to the end of its zlib stream (which
+        # carries the checksum); a torn write can cut it after the end record
+        if self.decompressor is None:
+            return
+        while not self.decompressor.eof:
+            chunk = self.f.read(self.CHUNK_SIZE)
+            if not chunk:
+                raise ValueError("Session file is truncated")
+            self.decompressor.decompress(chunk)
+    
+    def __iter__(self):
+        while True:
+            rec_type, payload = self.read_record()
+            if rec_type == REC_END:
+                self.check_end()
+                return
+            elif rec_type == REC_STRING:
+                self.strings.append(sys.intern(payload.decode("utf-8")))
+            elif rec_type == REC_META:
+                yield "meta", json.loads(payload.decode("utf-8"))
+            elif rec_type == REC_MEMORY:
+                yield "memory", Exchange.from_dict(json.loads(payload.decode("utf-8")))
+            elif rec_type == REC_MESSAGE:
+                yield "message", self.decode_message(payload)
+            # Unknown record types from newer minor revisions are skipped
+
+def read_session(filename):
+    session_data = {"session": {}, "config": {}, "memory": [], "messages": []}
+    with open(filename, 'rb') as f:
+        for kind, value in SessionReader(f):
+            if kind == "meta":
+                session_data.update(value)
             else:
-                return "neutral", "😐", 0
+                session_data["memory" if kind == "memory" else "messages"].append(value)
+    return session_data
+
+def convert_pickle_session(source, destination=None, compress=True):
+    # Only for legacy files you trust: unpickling can run arbitrary code
+    with open(source, 'rb') as f:
+        session_data = pickle.load(f)
+    data = encode_session(session_data, compress)
+    
+    destination = destination or source
+    tmp_path = f"{destination}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    if destination == source:
+        os.replace(source, source + ".pickle.bak")
+    os.replace(tmp_path, destination)
+    return destination
+
+# -------------------- Session Buffer -------------------- #
+class SessionBuffer:
+    # Transcript of the current session. The newest hot_limit messages stay
+    # in memory; older ones spill as JSON lines to an anonymous temp file and
+    # are read back through mmap. Positions are absolute, so indexing, len()
+    # and slices behave like the list this replaces. iterate() captures the
+    # buffer as it is at call time and streams it in batches, which lets a
+    # worker thread export a session while the UI keeps appending.
+    def __init__(self, hot_limit=2000, spill_batch=None):
+        self.hot_limit = max(1, hot_limit)
+        self.spill_batch = spill_batch or max(1, self.hot_limit // 4)
+        self.lock = threading.Lock()
+        self.spill = SpillFile()
+        self.hot = []
+        self.viewed = False
+    
+    def __len__(self):
+        with self.lock:
+            return len(self.spill) + len(self.hot)
+    
+    def append(self, msg):
+        with self.lock:
+            self.hot.append(msg)
+            if len(self.hot) > self.hot_limit:
+                count = min(len(self.hot), len(self.hot) - self.hot_limit + self.spill_batch)
+                self.spill.write(self.hot[:count])
+                del self.hot[:count]
+    
+    def extend(self, messages):
+        for msg in messages:
+            self.append(msg)
+    
+    def clear(self):
+        # Open iterators and views keep reading the old spill file and hot
+        # list; when views exist the hot messages are spilled first, so what
+        # outlives the clear costs only file offsets
+        with self.lock:
+            if self.viewed and self.hot:
+                self.spill.write(self.hot)
+                self.hot.clear()
+            self.spill = SpillFile()
+            self.hot = []
+            self.viewed = False
+    
+    def read(self, spill, hot, start, stop):
+        # Caller holds the lock
+        spilled = len(spill)
+        result = spill.read(start, min(stop, spilled)) if start < spilled else []
+        result.extend(hot[max(start - spilled, 0):max(stop - spilled, 0)])
+        return result
+    
+    def __getitem__(self, key):
+        with self.lock:
+            size = len(self.spill) + len(self.hot)
+            if isinstance(key, slice):
+                start, stop, step = key.indices(size)
+                if step != 1:
+                    return self.read(self.spill, self.hot, 0, size)[key]
+                return self.read(self.spill, self.hot, start, max(start, stop))
+            index = key + size if key < 0 else key
+            if not 0 <= index < size:
+                raise IndexError("session buffer index out of range")
+            return self.read(self.spill, self.hot, index, index + 1)[0]
+    
+    def iterate(self, start=0, stop=None, reverse=False, batch=500):
+        with self.lock:
+            spill, hot = self.spill, self.hot
+            size = len(spill) + len(hot)
+        stop = size if stop is None else min(stop, size)
+        return self.stream(spill, hot, start, stop, reverse, batch)
+    
+    def stream(self, spill, hot, start, stop, reverse, batch):
+        position = stop if reverse else start
+        while start < position if reverse else position < stop:
+            with self.lock:
+                if reverse:
+                    chunk = self.read(spill, hot, max(start, position - batch), position)
+                    chunk.reverse()
+                else:
+                    chunk = self.read(spill, hot, position, min(stop, position + batch))
+            if not chunk:
+                return
+            yield from chunk
+            position += -len(chunk) if reverse else len(chunk)
+    
+    def __iter__(self):
+        return self.iterate()
+    
+    def __reversed__(self):
+        return self.iterate(reverse=True)
+    
+    def view(self, stop=None):
+        # Read-only sequence of the first stop messages (all by default)
+        with self.lock:
+            self.viewed = True
+            size = len(self.spill) + len(self.hot)
+            return SessionSlice(self, self.spill, self.hot, 0, size if stop is None else min(stop, size))
+    
+    def get_stats(self):
+        with self.lock:
+            return {"messages": len(self.spill) + len(self.hot), "in_memory": len(self.hot),
+                    "spilled": len(self.spill), "spill_bytes": self.spill.size}
+
+class SessionSlice:
+    # Fixed range of a SessionBuffer as it was when the view was taken. Used
+    # as the messages of the live session's history record, so history holds
+    # no copy of the transcript; slicing returns another view.
+    __slots__ = ("buffer", "spill", "hot", "start", "stop")
+    
+    def __init__(self, buffer, spill, hot, start, stop):
+        self.buffer = buffer
+        self.spill = spill
+        self.hot = hot
+        self.start = start
+        self.stop = stop
+    
+    def __len__(self):
+        return self.stop - self.start
+    
+    def __iter__(self):
+        return self.buffer.stream(self.spill, self.hot, self.start, self.stop, False, 500)
+    
+    def __reversed__(self):
+        return self.buffer.stream(self.spill, self.hot, self.start, self.stop, True, 500)
+    
+    def __getitem__(self, key):
+        size = self.stop - self.start
+        if isinstance(key, slice):
+            start, stop, step = key.indices(size)
+            if step != 1:
+                return list(self)[key]
+            return SessionSlice(self.buffer, self.spill, self.hot, self.start + start,
+                                self.start + max(start, stop))
+        index = key + size if key < 0 else key
+        if not 0 <= index < size:
+            raise IndexError("session view index out of range")
+        with self.buffer.lock:
+            return self.buffer.read(self.spill, self.hot, self.start + index, self.start + index + 1)[0]
+
+class SpillFile:
+    # Append-only JSON-lines segment with an offset per message. The file is
+    # created on first write and removed by the OS when it is closed.
+    def __init__(self):
+        self.file = None
+        self.offsets = array("Q")
+        self.size = 0
+        self.map = None
+        self.mapped = 0
+    
+    def __len__(self):
+        return len(self.offsets)
+    
+    def write(self, messages):
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(prefix="chatbuddy-session-")
+        lines = []
+        for msg in messages:
+            line = json.dumps(msg, default=record_to_json).encode("utf-8") + b"\n"
+            self.offsets.append(self.size)
+            self.size += len(line)
+            lines.append(line)
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(b"".join(lines))
+        self.file.flush()
+    
+    def read(self, start, stop):
+        if start >= stop:
+            return []
+        if self.mapped < self.size:
+            # Remap after the file has grown
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mapped = self.size
+        end = self.offsets[stop] if stop < len(self.offsets) else self.size
+        data = self.map[self.offsets[start]:end]
+        return [Message.from_dict(json.loads(line)) for line in data.splitlines()]
 
 # -------------------- Main Application -------------------- #
 class ChatBuddyPro:
     def __init__(self):
+        ui_start = time.perf_counter()
         self.root = tk.Tk()
         self.root.title("ChatBuddy Pro 🤖")
         self.root.geometry("600x700")
         
         # Initialize components
         self.config = Config()
-        self.history = ChatHistory()
-        self.memory = ConversationMemory()
-        self.session = SessionManager()
-        self.engine = ResponseEngine()
+        self.writer = PersistenceWorker()
+        self.notifier = NotificationService(self.send_notification, self.config.notification_window,
+                                            self.config.notification_rate, self.config.notification_burst)
+        self.history = open_history(self.config, self.writer)
+        self.memory = ConversationMemory(self.config.max_memory)
+        self.session = SessionManager(self.config.mood_ema_alpha)
+        self.engine = ResponseEngine(SentimentService(self.config.sentiment_cache_size),
+                                     self.config.intent_classifier, self.config.intent_threshold,
+                                     self.config.typo_max_distance, self.config.typo_cache_size)
+        
+        # Reply pipeline shared with headless deployments
+        self.core = ConversationCore(self.engine, self.config.max_memory, self.config.session_capacity,
+                                     self.config.session_ttl, self.config.session_shards,
+                                     self.config.session_snapshots)
+        self.core.open_session(self.session.session_id, self.memory, self.session)
         
-        # Message storage for current session
-        self.current_messages = []
+        # Message storage for current session; old messages spill to disk
+        self.current_messages = SessionBuffer(self.config.session_hot_messages)
         
-        # Typing indicator flag
+        # Typing indicator flag and replies still waiting to be shown
         self.typing = False
+        self.pending_replies = 0
+        
+        # Set while a session file streams in; auto-save skips partial loads
+        self.loading_session = False
+        
+        # One scheduler holds every pending reply; no thread per message
+        self.scheduler = ReplyScheduler(self.config.reply_delay, self.config.reply_jitter)
+        self.scheduler_timer = None
+        self.scheduler_due = None
+        
+        # Render batching state (see render_frame)
+        self.batch_rendering = False
+        self.batch_at_bottom = True
+        self.pending_status = None
+        
+        # Indexes into current_messages of the messages in the widget; each
+        # has a (right-gravity) text mark "msg<index>" at its start
+        self.rendered = deque()
+        self.loading_earlier = False
+        
+        # Autocomplete, seeded from response patterns and past messages
+        self.completions = CompletionTrie(self.config.suggestion_count)
+        self.completions_loaded = False
+        self.completions_lock = threading.Lock()
+        self.suggestion_timer = None
+        self.shown_suggestions = []
         
         # Setup UI
         self.setup_menu()
         self.setup_ui()
         self.apply_theme()
+        STARTUP.record("ui build", time.perf_counter() - ui_start)
+        
+        # First paint happens once the event loop is idle
+        self.root.after_idle(self.on_first_paint)
         
         # Auto-save timer
         if self.config.auto_save:
             self.root.after(30000, self.auto_save)  # Auto-save every 30 seconds
+        
+        # Deliver persistence completions on the Tk thread
+        self.root.after(100, self.poll_persistence)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
     
     def setup_menu(self):
         menubar = Menu(self.root)
@@ -360,7 +3649,7 @@ class ChatBuddyPro:
         file_menu.add_separator()
         file_menu.add_command(label="Clear History", command=self.clear_history)
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.quit)
+        file_menu.add_command(label="Exit", command=self.on_close)
         
         # Edit menu
         edit_menu = Menu(menubar, tearoff=0)
@@ -371,6 +3660,7 @@ class ChatBuddyPro:
         view_menu = Menu(menubar, tearoff=0)
         view_menu.add_command(label="Session Stats", command=self.show_stats)
         view_menu.add_command(label="Chat History", command=self.show_history)
+        view_menu.add_command(label="Search History", command=self.show_search)
         
         # Tools menu
         tools_menu = Menu(menubar, tearoff=0)
@@ -407,7 +3697,7 @@ class ChatBuddyPro:
             spacing3=5
         )
         self.chat_area.pack(fill=tk.BOTH, expand=True)
-        self.chat_area.config(state='disabled')
+        self.chat_area.config(state='disabled', yscrollcommand=self.on_chat_scroll)
         
         # Configure tags for message styling
         self.setup_text_tags()
@@ -575,40 +3865,185 @@ class ChatBuddyPro:
         # Update status bar
         self.status_bar.config(bg=theme["bg"], fg=theme["fg"])
     
-    def add_message(self, sender, message, msg_type="user", show_time=True):
+    def render_frame(self, commands):
+        # One state toggle, one scroll and one status update for the batch
+        self.batch_at_bottom = self.at_bottom()
         self.chat_area.config(state='normal')
+        self.batch_rendering = True
+        try:
+            for func, args in commands:
+                func(*args)
+        finally:
+            self.batch_rendering = False
+            self.chat_area.config(state='disabled')
+            self.chat_area.see(tk.END)
+            
+            if self.pending_status is not None:
+                status, self.pending_status = self.pending_status, None
+                self.update_status(status)
+    
+    def insert_index(self):
+        # While the typing indicator is shown, new text goes in front of it
+        return "typing_start" if self.typing else tk.END
+    
+    def message_chunks(self, sender, message, msg_type, timestamp=None):
+        # Alternating text/tag arguments for a single Text.insert call
+        chunks = []
         
         # Add timestamp
-        if show_time:
-            timestamp = datetime.now().strftime("%H:%M")
-            self.chat_area.insert(tk.END, f"[{timestamp}] ", "timestamp")
+        if timestamp:
+            chunks += [f"[{timestamp}] ", "timestamp"]
         
         # Add sender name
-        self.chat_area.insert(tk.END, f"{sender}: ", "bold")
+        chunks += [f"{sender}: ", "bold"]
         
         # Add message with appropriate styling
-        if msg_type == "user":
-            self.chat_area.insert(tk.END, f"{message}\n\n", "user")
-        elif msg_type == "bot":
-            self.chat_area.insert(tk.END, f"{message}\n\n", "bot")
-        elif msg_type == "system":
-            self.chat_area.insert(tk.END, f"{message}\n\n", "system")
-        elif msg_type == "error":
-            self.chat_area.insert(tk.END, f"{message}\n\n", "error")
+        if msg_type in ("user", "bot", "system", "error"):
+            chunks += [f"{message}\n\n", msg_type]
+        return chunks
+    
+    def stored_chunks(self, msg, show_time=True):
+        msg_type = msg.get("type")
+        if msg_type not in ("user", "bot", "system", "error"):
+            msg_type = "user" if msg.get("sender") == "You" else "bot"
         
-        self.chat_area.config(state='disabled')
-        self.chat_area.see(tk.END)
+        timestamp = msg.get("timestamp") if show_time else None
+        if timestamp:
+            try:
+                timestamp = datetime.fromisoformat(timestamp).strftime("%H:%M")
+            except ValueError:
+                timestamp = None
+        return self.message_chunks(msg.get("sender", "System"), msg.get("message", ""), msg_type, timestamp)
+    
+    def is_renderable(self, msg):
+        return msg.get("type") != "attachment" and "message" in msg
+    
+    def add_message(self, sender, message, msg_type="user", show_time=True, analysis=None):
+        # Sample the scroll position before the insert moves it
+        if self.batch_rendering:
+            at_bottom = self.batch_at_bottom
+        else:
+            at_bottom = self.at_bottom()
+            self.chat_area.config(state='normal')
+        index = self.insert_index()
+        
+        # Remember where this message starts so it can be trimmed later
+        msg_index = len(self.current_messages)
+        start = self.chat_area.index("end-1c" if index == tk.END else index)
+        timestamp = datetime.now().strftime("%H:%M") if show_time else None
+        self.chat_area.insert(index, *self.message_chunks(sender, message, msg_type, timestamp))
+        self.chat_area.mark_set(f"msg{msg_index}", start)
+        self.rendered.append(msg_index)
+        self.trim_transcript(force=at_bottom)
+        
+        if not self.batch_rendering:
+            self.chat_area.config(state='disabled')
+            self.chat_area.see(tk.END)
         
         # Store in current messages
-        self.current_messages.append({
-            "sender": sender,
-            "message": message,
-            "type": msg_type,
-            "timestamp": datetime.now().isoformat()
-        })
+        record = Message.now(sender, message, msg_type)
+        record.analysis = analysis
+        self.current_messages.append(record)
         
         # Update status
-        self.update_status(f"Message from {sender}")
+        if self.batch_rendering:
+            self.pending_status = f"Message from {sender}"
+        else:
+            self.update_status(f"Message from {sender}")
+    
+    def at_bottom(self):
+        return self.chat_area.yview()[1] >= 0.999
+    
+    def trim_transcript(self, force=False):
+        # Keep at most render_window messages in the widget. Trimming waits
+        # while the user is scrolled up reading older messages; callers that
+        # sampled the view before inserting pass force when it was at the end.
+        excess = len(self.rendered) - self.config.render_window
+        if excess <= 0 or (not force and not self.at_bottom()):
+            return
+        
+        for _ in range(excess):
+            self.chat_area.mark_unset(f"msg{self.rendered.popleft()}")
+        self.chat_area.delete("1.0", f"msg{self.rendered[0]}")
+    
+    def reset_transcript(self):
+        self.chat_area.config(state='normal')
+        self.chat_area.delete(1.0, tk.END)
+        self.chat_area.config(state='disabled')
+        for msg_index in self.rendered:
+            self.chat_area.mark_unset(f"msg{msg_index}")
+        self.rendered.clear()
+        self.typing = False
+    
+    def append_transcript(self, start, show_time=False):
+        # Bulk restore of current_messages[start:]: the newest render_window
+        # of them are built into one tagged insert with no per-message
+        # scrolling, status or storage. Every rendered message ends in a blank
+        # line, so each one starts at column 0 and its mark can be derived
+        # from a running line count.
+        messages = self.current_messages
+        indexes = []
+        for msg_index in range(len(messages) - 1, start - 1, -1):
+            if len(indexes) >= self.config.render_window:
+                break
+            if self.is_renderable(messages[msg_index]):
+                indexes.append(msg_index)
+        indexes.reverse()
+        
+        chunks = []
+        starts = []
+        line = int(self.chat_area.index("end-1c").split(".")[0])
+        for msg_index in indexes:
+            message_chunks = self.stored_chunks(messages[msg_index], show_time)
+            starts.append(line)
+            line += sum(text.count("\n") for text in message_chunks[::2])
+            chunks.extend(message_chunks)
+        
+        if not chunks:
+            return
+        
+        self.chat_area.config(state='normal')
+        self.chat_area.insert(tk.END, *chunks)
+        for msg_index, start_line in zip(indexes, starts):
+            self.chat_area.mark_set(f"msg{msg_index}", f"{start_line}.0")
+        self.rendered.extend(indexes)
+        self.trim_transcript(force=True)
+        self.chat_area.config(state='disabled')
+        self.chat_area.see(tk.END)
+    
+    def on_chat_scroll(self, first, last):
+        self.chat_area.vbar.set(first, last)
+        if float(first) <= 0.0 and not self.loading_earlier and self.rendered:
+            self.loading_earlier = True
+            self.root.after_idle(self.load_earlier_messages)
+    
+    def load_earlier_messages(self):
+        # Prepend the previous page of the full transcript kept in the model
+        try:
+            if not self.rendered or self.rendered[0] == 0:
+                return
+            
+            first = self.rendered[0]
+            page = []
+            index = first - 1
+            while index >= 0 and len(page) < self.config.render_page:
+                if self.is_renderable(self.current_messages[index]):
+                    page.append(index)
+                index -= 1
+            if not page:
+                return
+            
+            self.chat_area.config(state='normal')
+            for msg_index in page:  # Newest first, each inserted at the top
+                self.chat_area.insert("1.0", *self.stored_chunks(self.current_messages[msg_index]))
+                self.chat_area.mark_set(f"msg{msg_index}", "1.0")
+                self.rendered.appendleft(msg_index)
+            self.chat_area.config(state='disabled')
+            
+            # Keep the message the user was looking at in place
+            self.chat_area.yview(f"msg{first}")
+        finally:
+            self.loading_earlier = False
     
     def send_message(self):
         user_msg = self.input_field.get().strip()
@@ -617,93 +4052,148 @@ class ChatBuddyPro:
         
         # Clear input field
         self.input_field.delete(0, tk.END)
-        self.suggestion_listbox.place_forget()
-        
-        # Add user message to chat
-        self.add_message("You", user_msg, "user")
-        self.session.message_count += 1
-        self.session.user_messages += 1
+        self.hide_suggestions()
         
-        # Analyze sentiment
-        sentiment, emoji, score = self.engine.analyze_sentiment(user_msg)
+        # Analyzed once here; the stored record, sentiment, intent matching,
+        # context checks and memory summary all share the result
+        analysis = MessageAnalysis(user_msg)
         
-        # Get response with context
-        context = self.memory.get_context()
-        response = self.engine.get_response(user_msg, context, sentiment)
+        # Add user message to chat
+        self.add_message("You", user_msg, "user", analysis=analysis)
+        self.completions.add(analysis.normalized)
         
-        # Store in memory
-        self.memory.add_exchange(user_msg, response)
+        # Sentiment, context, response and memory are handled by the core
+        reply = self.core.reply(self.session.session_id, analysis)
         
         # Show typing indicator
+        self.pending_replies += 1
         self.show_typing_indicator()
         
-        # Bot response with delay
-        def bot_reply():
-            time.sleep(0.8 + random.random() * 0.5)  # Natural delay
-            
-            # Hide typing indicator
+        # Bot response after the simulated typing delay
+        self.scheduler.schedule(self.deliver_reply, reply["display"])
+        self.arm_scheduler()
+    
+    def arm_scheduler(self):
+        # Keep a single root.after timer aimed at the earliest pending reply
+        wait = self.scheduler.time_until_next()
+        if wait is None:
+            return
+        
+        due = time.monotonic() + wait
+        if self.scheduler_timer is not None:
+            if self.scheduler_due <= due:
+                return
+            self.root.after_cancel(self.scheduler_timer)
+        
+        self.scheduler_due = due
+        self.scheduler_timer = self.root.after(int(wait * 1000), self.run_scheduler)
+    
+    def run_scheduler(self):
+        self.scheduler_timer = None
+        due = self.scheduler.pop_due()
+        if due:
+            self.render_frame(due)
+        self.arm_scheduler()
+    
+    def deliver_reply(self, message):
+        self.pending_replies = max(0, self.pending_replies - 1)
+        
+        # Hide typing indicator once the last pending reply arrives
+        if not self.pending_replies:
             self.hide_typing_indicator()
-            
-            # Add sentiment emoji if not neutral
-            if sentiment != "neutral":
-                response_with_emoji = f"{emoji} {response}"
-            else:
-                response_with_emoji = response
-            
-            self.add_message("ChatBuddy Pro", response_with_emoji, "bot")
-            self.session.message_count += 1
-            self.session.bot_messages += 1
-            
-            # Send notification
-            if self.config.enable_notifications and NOTIFICATIONS:
-                self.send_notification("ChatBuddy Pro", "New message received")
         
-        threading.Thread(target=bot_reply, daemon=True).start()
+        self.add_message("ChatBuddy Pro", message, "bot")
+        self.core.record_delivery(self.session.session_id)
+        
+        # Queue a notification; merging, rate limiting and the actual
+        # desktop call happen on the notifier thread
+        if self.config.enable_notifications and NOTIFICATIONS:
+            self.notifier.notify("ChatBuddy Pro", "New message received", self.window_focused())
     
     def show_typing_indicator(self):
         if not self.typing:
             self.typing = True
-            self.chat_area.config(state='normal')
+            if not self.batch_rendering:
+                self.chat_area.config(state='normal')
+            # The mark stays in front of the indicator; with right gravity,
+            # messages inserted at it land before the indicator in order
+            self.chat_area.mark_set("typing_start", "end-1c")
+            self.chat_area.mark_gravity("typing_start", tk.LEFT)
             self.chat_area.insert(tk.END, "ChatBuddy Pro is typing...\n", "typing")
-            self.chat_area.config(state='disabled')
-            self.chat_area.see(tk.END)
+            self.chat_area.mark_gravity("typing_start", tk.RIGHT)
+            if not self.batch_rendering:
+                self.chat_area.config(state='disabled')
+                self.chat_area.see(tk.END)
     
     def hide_typing_indicator(self):
         if self.typing:
             self.typing = False
-            self.chat_area.config(state='normal')
-            # Remove the last line (typing indicator)
-            end_line = self.chat_area.index(tk.END)
-            last_line_num = int(end_line.split('.')[0]) - 1
-            self.chat_area.delete(f"{last_line_num}.0", tk.END)
-            self.chat_area.config(state='disabled')
+            if not self.batch_rendering:
+                self.chat_area.config(state='normal')
+            # Remove the typing indicator, wherever later inserts left it
+            self.chat_area.delete("typing_start", "end-1c")
+            if not self.batch_rendering:
+                self.chat_area.config(state='disabled')
     
     def suggest_completion(self, event):
-        suggestions = [
-            "hello", "how are you", "tell me a joke", "what time is it",
-            "thank you", "goodbye", "help", "analyze my mood"
-        ]
-        
-        current_text = self.input_field.get().lower()
+        # Debounced: the lookup runs once typing pauses
+        if self.suggestion_timer is not None:
+            self.root.after_cancel(self.suggestion_timer)
+        self.suggestion_timer = self.root.after(self.config.suggestion_delay, self.update_suggestions)
+    
+    def update_suggestions(self):
+        self.suggestion_timer = None
+        self.ensure_completions()
+        matches = self.completions.complete(self.input_field.get())
         
-        if not current_text:
-            self.suggestion_listbox.place_forget()
+        # The listbox is only touched when the suggestion set changes
+        if matches == self.shown_suggestions:
+            return
+        if not matches:
+            self.hide_suggestions()
             return
         
-        matches = [s for s in suggestions if s.startswith(current_text)]
+        self.suggestion_listbox.delete(0, tk.END)
+        for match in matches:
+            self.suggestion_listbox.insert(tk.END, match)
         
-        if matches:
+        if not self.shown_suggestions:
             # Position listbox below input field
             x = self.input_field.winfo_rootx() - self.root.winfo_rootx()
             y = self.input_field.winfo_rooty() - self.root.winfo_rooty() + self.input_field.winfo_height()
-            
-            self.suggestion_listbox.delete(0, tk.END)
-            for match in matches[:4]:  # Show max 4 suggestions
-                self.suggestion_listbox.insert(tk.END, match)
-            
             self.suggestion_listbox.place(x=x, y=y, width=self.input_field.winfo_width())
-        else:
+        self.shown_suggestions = matches
+    
+    def hide_suggestions(self):
+        if self.suggestion_timer is not None:
+            self.root.after_cancel(self.suggestion_timer)
+            self.suggestion_timer = None
+        if self.shown_suggestions:
             self.suggestion_listbox.place_forget()
+            self.shown_suggestions = []
+    
+    def ensure_completions(self):
+        # Seeds the trie once; the warm-up thread normally gets here first
+        with self.completions_lock:
+            if self.completions_loaded:
+                return
+            self.completions_loaded = True
+        
+        for phrase in ("hello", "how are you", "tell me a joke", "what time is it",
+                       "thank you", "goodbye", "help", "analyze my mood"):
+            self.completions.add(phrase)
+        for category in self.engine.responses.values():
+            for pattern in category["patterns"] + category.get("examples", []):
+                self.completions.add(pattern)
+        if self.config.save_history:
+            # Words the user has typed more than once are real words to them
+            seen = {}
+            for text in self.history.sent_messages():
+                self.completions.add(text)
+                for word in SpellCorrector.TOKEN_RE.findall(text.lower()):
+                    seen[word] = seen.get(word, 0) + 1
+            if self.engine.corrector is not None:
+                self.engine.corrector.add_known(word for word, count in seen.items() if count > 1)
     
     def use_suggestion(self, event):
         selection = self.suggestion_listbox.curselection()
@@ -711,7 +4201,7 @@ class ChatBuddyPro:
             suggestion = self.suggestion_listbox.get(selection[0])
             self.input_field.delete(0, tk.END)
             self.input_field.insert(0, suggestion)
-            self.suggestion_listbox.place_forget()
+            self.hide_suggestions()
     
     def attach_file(self):
         filepath = filedialog.askopenfilename(
@@ -731,66 +4221,64 @@ class ChatBuddyPro:
             self.add_message("System", f"📎 Attached: {filename} ({file_size:.1f} KB)", "system")
             
             # Store attachment info
-            self.current_messages.append({
-                "type": "attachment",
-                "filename": filename,
-                "path": filepath,
-                "size": file_size,
-                "timestamp": datetime.now().isoformat()
-            })
+            self.current_messages.append(Message.now(None, None, "attachment", filename=filename,
+                                                     path=filepath, size=file_size))
     
     def analyze_sentiment(self):
-        # Analyze the last user message
-        if self.current_messages:
-            user_messages = [msg for msg in self.current_messages 
-                           if msg.get("sender") == "You"]
+        # Analyze the last user message, scanning back from the newest
+        last_msg = next((msg.analysis or msg["message"] for msg in reversed(self.current_messages)
+                         if msg.get("sender") == "You"), None)
+        if last_msg is not None:
+            sentiment, emoji, score = self.engine.analyze_sentiment(last_msg)
             
-            if user_messages:
-                last_msg = user_messages[-1]["message"]
-                sentiment, emoji, score = self.engine.analyze_sentiment(last_msg)
-                
-                self.add_message("System", 
-                    f"Sentiment Analysis: {sentiment.capitalize()} {emoji} (Score: {score:.2f})",
-                    "system")
-                
-                # Provide feedback based on sentiment
-                feedback = {
-                    "positive": "Great to see you're in a positive mood! 😊",
-                    "negative": "I'm here if you want to talk. ❤️",
-                    "neutral": "Keeping things balanced, I see! 😊"
-                }
-                
-                if sentiment in feedback:
-                    self.add_message("ChatBuddy Pro", feedback[sentiment], "bot")
+            self.add_message("System", 
+                f"Sentiment Analysis: {sentiment.capitalize()} {emoji} (Score: {score:.2f})",
+                "system")
+            
+            # Provide feedback based on sentiment
+            feedback = {
+                "positive": "Great to see you're in a positive mood! 😊",
+                "negative": "I'm here if you want to talk. ❤️",
+                "neutral": "Keeping things balanced, I see! 😊"
+            }
+            
+            if sentiment in feedback:
+                self.add_message("ChatBuddy Pro", feedback[sentiment], "bot")
     
     def analyze_current_sentiment(self):
-        if self.current_messages:
-            all_text = " ".join([msg["message"] for msg in self.current_messages 
-                               if msg.get("type") in ["user", "bot"] and msg.get("sender") == "You"])
+        # Reads the running aggregate kept by the core; no transcript rescan
+        stats = self.session.sentiment.get_stats()
+        
+        if stats["count"]:
+            sentiment, emoji = stats["overall"]
+            current, current_emoji = stats["current_mood"]
             
-            if all_text:
-                sentiment, emoji, score = self.engine.analyze_sentiment(all_text)
-                
-                messagebox.showinfo("Sentiment Analysis",
-                    f"Overall Conversation Sentiment:\n\n"
-                    f"Mood: {sentiment.capitalize()} {emoji}\n"
-                    f"Score: {score:.2f}\n\n"
-                    f"Positive: > 0.3\n"
-                    f"Neutral: -0.3 to 0.3\n"
-                    f"Negative: < -0.3")
+            messagebox.showinfo("Sentiment Analysis",
+                f"Overall Conversation Sentiment:\n\n"
+                f"Mood: {sentiment.capitalize()} {emoji}\n"
+                f"Score: {stats['mean']:.2f} (variance {stats['variance']:.2f}, "
+                f"{stats['count']} messages)\n\n"
+                f"Current Mood: {current.capitalize()} {current_emoji} ({stats['current']:.2f})\n"
+                f"Trend: {stats['trend']}\n\n"
+                f"Positive: > 0.3\n"
+                f"Neutral: -0.3 to 0.3\n"
+                f"Negative: < -0.3")
     
     def clear_chat(self):
         if messagebox.askyesno("Clear Chat", "Are you sure you want to clear the chat?"):
-            self.chat_area.config(state='normal')
-            self.chat_area.delete(1.0, tk.END)
-            self.chat_area.config(state='disabled')
+            self.reset_transcript()
+            
+            # Drop replies that have not been shown yet
+            self.scheduler.cancel_all()
+            self.pending_replies = 0
             
             # Save current conversation before clearing
-            if self.current_messages:
-                self.history.save_conversation(self.current_messages, self.session.session_id)
+            self.history.sync_conversation(self.current_messages, self.session.session_id)
+            self.history.end_conversation(self.session.session_id)
             
             self.current_messages.clear()
             self.memory.clear()
+            self.session.sentiment.reset()
             
             self.add_message("System", "Chat cleared. New session started.", "system")
             self.update_status("Chat cleared | New session")
@@ -806,18 +4294,26 @@ class ChatBuddyPro:
         )
         
         if filename:
-            try:
-                with open(filename, 'w') as f:
-                    json.dump({
-                        "session_info": self.session.get_stats(),
-                        "messages": self.current_messages,
-                        "summary": self.memory.get_conversation_summary()
-                    }, f, indent=2)
-                
-                messagebox.showinfo("Success", f"Chat saved to:\n{filename}")
-                self.update_status(f"Chat saved to {os.path.basename(filename)}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save chat: {str(e)}")
+            session_info = self.session.get_stats()
+            summary = self.memory.get_conversation_summary()
+            messages = self.current_messages.iterate()
+            
+            def render():
+                # Streamed one message at a time; spilled messages never load at once
+                yield '{\n  "session_info": ' + json.dumps(session_info) + ',\n  "messages": ['
+                for index, msg in enumerate(messages):
+                    yield ("," if index else "") + "\n    " + json.dumps(msg, default=record_to_json)
+                yield '\n  ],\n  "summary": ' + json.dumps(summary) + "\n}"
+            
+            def saved(error):
+                if error:
+                    messagebox.showerror("Error", f"Failed to save chat: {str(error)}")
+                else:
+                    messagebox.showinfo("Success", f"Chat saved to:\n{filename}")
+                    self.update_status(f"Chat saved to {os.path.basename(filename)}")
+            
+            self.writer.write_file(filename, render, on_done=saved)
+            self.update_status("Saving chat...")
     
     def export_chat(self):
         if not self.current_messages:
@@ -830,38 +4326,45 @@ class ChatBuddyPro:
         )
         
         if filename:
-            try:
-                with open(filename, 'w') as f:
-                    f.write("=" * 50 + "\n")
-                    f.write(f"CHAT EXPORT - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    f.write("=" * 50 + "\n\n")
-                    
-                    for msg in self.current_messages:
-                        if msg.get("type") == "attachment":
-                            f.write(f"[ATTACHMENT] {msg.get('filename')} ({msg.get('size', 0):.1f} KB)\n")
-                        else:
-                            timestamp = msg.get('timestamp', '')
-                            if timestamp:
-                                try:
-                                    dt = datetime.fromisoformat(timestamp)
-                                    timestamp = dt.strftime("%H:%M")
-                                except:
-                                    pass
-                            
-                            sender = msg.get('sender', 'System')
-                            message = msg.get('message', '')
-                            f.write(f"[{timestamp}] {sender}: {message}\n")
+            messages = self.current_messages.iterate()
+            exported_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            
+            def render():
+                yield "=" * 50 + "\n" + f"CHAT EXPORT - {exported_at}\n" + "=" * 50 + "\n\n"
                 
-                messagebox.showinfo("Success", f"Chat exported to:\n{filename}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to export chat: {str(e)}")
+                for msg in messages:
+                    if msg.get("type") == "attachment":
+                        yield f"[ATTACHMENT] {msg.get('filename')} ({msg.get('size', 0):.1f} KB)\n"
+                    else:
+                        timestamp = msg.get('timestamp', '')
+                        if timestamp:
+                            try:
+                                dt = datetime.fromisoformat(timestamp)
+                                timestamp = dt.strftime("%H:%M")
+                            except:
+                                pass
+                        
+                        sender = msg.get('sender', 'System')
+                        message = msg.get('message', '')
+                        yield f"[{timestamp}] {sender}: {message}\n"
+            
+            def exported(error):
+                if error:
+                    messagebox.showerror("Error", f"Failed to export chat: {str(error)}")
+                else:
+                    messagebox.showinfo("Success", f"Chat exported to:\n{filename}")
+            
+            self.writer.write_file(filename, render, on_done=exported)
+            self.update_status("Exporting chat...")
     
     def save_session(self):
         session_data = {
             "session": self.session.get_stats(),
             "memory": list(self.memory.memory),
-            "config": self.config.__dict__,
-            "messages": self.current_messages
+            "topics": self.memory.topics.get_state(),
+            "sentiment": self.session.sentiment.get_state(),
+            "config": dict(self.config.__dict__),
+            "messages": self.current_messages.iterate()
         }
         
         filename = filedialog.asksaveasfilename(
@@ -870,54 +4373,143 @@ class ChatBuddyPro:
         )
         
         if filename:
-            try:
-                with open(filename, 'wb') as f:
-                    pickle.dump(session_data, f)
-                messagebox.showinfo("Success", "Session saved successfully!")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save session: {str(e)}")
+            compress = self.config.session_compression
+            
+            def saved(error):
+                if error:
+                    messagebox.showerror("Error", f"Failed to save session: {str(error)}")
+                else:
+                    messagebox.showinfo("Success", "Session saved successfully!")
+            
+            self.writer.write_file(filename, lambda: iter_session(session_data, compress), on_done=saved)
     
     def load_session(self):
         filename = filedialog.askopenfilename(
             filetypes=[("Chat session", "*.chat"), ("All files", "*.*")]
         )
         
-        if filename:
+        if not filename:
+            return
+        
+        try:
+            with open(filename, 'rb') as f:
+                legacy = not SessionReader.is_session_file(f)
+            
+            if legacy:
+                if not messagebox.askyesno("Legacy Session",
+                        "This session was saved in the old pickle format, which can run code "
+                        "when it is opened.\n\nConvert it to the new format and load it? "
+                        "Only continue for files you trust."):
+                    return
+                convert_pickle_session(filename, compress=self.config.session_compression)
+            
+            # The header and first record are read before the current chat
+            # is discarded, so a file that is not a session leaves it alone
+            f = open(filename, 'rb')
             try:
-                with open(filename, 'rb') as f:
-                    session_data = pickle.load(f)
-                
-                # Clear current chat
-                self.chat_area.config(state='normal')
-                self.chat_area.delete(1.0, tk.END)
-                self.chat_area.config(state='disabled')
-                
-                # Load messages
-                self.current_messages = session_data.get("messages", [])
-                for msg in self.current_messages:
-                    if msg.get("type") == "system":
-                        self.add_message("System", msg.get("message", ""), "system", show_time=False)
-                    elif msg.get("sender") == "You":
-                        self.add_message("You", msg.get("message", ""), "user", show_time=False)
-                    elif msg.get("sender") == "ChatBuddy Pro":
-                        self.add_message("ChatBuddy Pro", msg.get("message", ""), "bot", show_time=False)
-                
-                # Load memory
-                self.memory.memory = deque(session_data.get("memory", []), maxlen=10)
-                
-                messagebox.showinfo("Success", "Session loaded successfully!")
-                self.update_status(f"Loaded session from {os.path.basename(filename)}")
+                records = iter(SessionReader(f))
+                first = next(records, None)
+            except Exception:
+                f.close()
+                raise
+            if first is not None:
+                records = itertools.chain([first], records)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load session: {str(e)}")
+            return
+        
+        # Replies still queued for the current chat must not land in the
+        # loaded one; the transcript reset also drops the typing indicator
+        self.scheduler.cancel_all()
+        self.pending_replies = 0
+        
+        # Clear current chat
+        self.reset_transcript()
+        self.history.end_conversation(self.session.session_id)
+        self.current_messages.clear()
+        self.session.sentiment.reset()
+        memory = []
+        meta = {}
+        
+        # Input is paused while records stream in
+        self.input_field.config(state='disabled')
+        self.send_btn.config(state='disabled')
+        self.loading_session = True
+        
+        def finish(error=None):
+            f.close()
+            self.loading_session = False
+            self.input_field.config(state='normal')
+            self.send_btn.config(state='normal')
+            if error is not None:
+                # A file that breaks off midway leaves a fresh chat rather
+                # than part of the saved one
+                self.reset_transcript()
+                self.current_messages.clear()
+                self.memory.clear()
+                self.session.sentiment.reset()
+                messagebox.showerror("Error", f"Failed to load session: {str(error)}")
+                self.update_status("Session load failed | New session")
+                return
+            
+            # Sessions saved before the sentiment state was stored get it
+            # rebuilt from the transcript, streamed in batches
+            if meta.get("sentiment") is not None:
+                self.session.sentiment.set_state(meta["sentiment"])
+            else:
+                user_texts = (msg.get("message", "") for msg in self.current_messages
+                              if msg.get("sender") == "You")
+                while True:
+                    batch = list(itertools.islice(user_texts, 1000))
+                    if not batch:
+                        break
+                    for _, _, score in self.engine.sentiment.analyze_batch(batch):
+                        self.session.sentiment.update(score)
+            
+            # Load memory and session-wide topic counts
+            self.memory.restore(memory, meta.get("topics"))
+            
+            messagebox.showinfo("Success", "Session loaded successfully!")
+            self.update_status(f"Loaded session from {os.path.basename(filename)}")
+        
+        def load_batch():
+            # Each batch is rendered as soon as it is parsed
+            start = len(self.current_messages)
+            count = 0
+            try:
+                for kind, value in records:
+                    if kind == "message":
+                        self.current_messages.append(value)
+                    elif kind == "memory":
+                        memory.append(value)
+                    elif kind == "meta":
+                        meta.update(value)
+                    count += 1
+                    if count >= 2000:
+                        break
             except Exception as e:
-                messagebox.showerror("Error", f"Failed to load session: {str(e)}")
+                finish(e)
+                return
+            
+            self.append_transcript(start)
+            if count >= 2000:
+                self.update_status(f"Loading session... {len(self.current_messages)} messages")
+                self.root.after(1, load_batch)
+            else:
+                finish()
+        
+        load_batch()
     
     def clear_history(self):
         if messagebox.askyesno("Clear History", "Are you sure you want to clear all chat history?"):
-            self.history.conversations.clear()
-            self.history.save_to_file()
+            self.history.clear()
             messagebox.showinfo("Success", "Chat history cleared.")
     
     def show_stats(self):
         stats = self.session.get_stats()
+        cache = self.engine.sentiment.get_stats()
+        buffer = self.current_messages.get_stats()
+        notices = self.notifier.get_stats()
         
         stats_text = f"""Session Statistics:
 ────────────────
@@ -930,7 +4522,17 @@ Total Messages: {stats['total_messages']}
 - Bot: {stats['bot_messages']}
 ────────────────
 Memory Usage: {len(self.memory.memory)} exchanges
-Context Window: {self.memory.maxlen}
+Context Window: {self.memory.memory.maxlen}
+Transcript: {buffer['in_memory']} in memory, {buffer['spilled']} on disk ({buffer['spill_bytes'] / 1024:.0f} KB)
+────────────────
+Sentiment Cache: {cache['entries']}/{cache['capacity']} entries
+- Hits: {cache['hits']}
+- Misses: {cache['misses']}
+- Hit Rate: {cache['hit_rate']}
+────────────────
+Notifications: {notices['delivered']} shown
+- Queued: {notices['queued']}, merged: {notices['merged']}
+- Dropped: {notices['dropped']}, skipped while focused: {notices['suppressed']}
 ────────────────"""
         
         messagebox.showinfo("Session Statistics", stats_text)
@@ -942,22 +4544,108 @@ Context Window: {self.memory.maxlen}
     def show_history(self):
         history_window = Toplevel(self.root)
         history_window.title("Chat History")
-        history_window.geometry("500x400")
+        history_window.geometry("600x500")
+        
+        page_size = 100
+        state = {"page": 0, "entries": []}
+        
+        nav_frame = tk.Frame(history_window)
+        nav_frame.pack(fill=tk.X, padx=10, pady=(10, 0))
+        
+        session_list = tk.Listbox(history_window, height=12, font=("Courier", 9))
+        session_list.pack(fill=tk.X, padx=10, pady=5)
+        
+        detail_text = scrolledtext.ScrolledText(history_window, wrap=tk.WORD)
+        detail_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        detail_text.insert(tk.END, "Select a session to view its messages.")
+        detail_text.config(state='disabled')
+        
+        page_label = tk.Label(nav_frame)
+        
+        def format_time(value):
+            return value.replace("T", " ")[:16] if value else "?"
+        
+        def show_page(page):
+            # Only metadata for one page is read; message bodies stay on disk
+            total = self.history.count_sessions()
+            pages = max(1, (total + page_size - 1) // page_size)
+            page = max(0, min(page, pages - 1))
+            state["page"] = page
+            state["entries"] = self.history.session_page(page, page_size)
+            
+            session_list.delete(0, tk.END)
+            for i, (key, session_id, start, end, count) in enumerate(state["entries"], page * page_size + 1):
+                session_list.insert(tk.END,
+                    f"{i:>5}. {session_id}  {format_time(start)} - {format_time(end)}  ({count} msgs)")
+            if not state["entries"]:
+                session_list.insert(tk.END, "No chat history available.")
+            page_label.config(text=f"Page {page + 1} of {pages} ({total} sessions)")
+        
+        def open_session(event):
+            selection = session_list.curselection()
+            if not selection or selection[0] >= len(state["entries"]):
+                return
+            key, session_id = state["entries"][selection[0]][:2]
+            
+            detail_text.config(state='normal')
+            detail_text.delete(1.0, tk.END)
+            detail_text.insert(tk.END, f"Session {session_id}\n{'-'*40}\n")
+            for msg in self.history.load_messages(key):
+                if msg.get("type") == "attachment":
+                    detail_text.insert(tk.END, f"[ATTACHMENT] {msg.get('filename')}\n")
+                else:
+                    detail_text.insert(tk.END, f"{msg.get('sender', 'System')}: {msg.get('message', '')}\n")
+            detail_text.config(state='disabled')
+        
+        session_list.bind("<<ListboxSelect>>", open_session)
+        tk.Button(nav_frame, text="< Newer", command=lambda: show_page(state["page"] - 1)).pack(side=tk.LEFT)
+        page_label.pack(side=tk.LEFT, expand=True)
+        tk.Button(nav_frame, text="Older >", command=lambda: show_page(state["page"] + 1)).pack(side=tk.RIGHT)
+        
+        show_page(0)
+    
+    def show_search(self):
+        search_window = Toplevel(self.root)
+        search_window.title("Search History")
+        search_window.geometry("550x450")
         
-        history_text = scrolledtext.ScrolledText(history_window, wrap=tk.WORD)
-        history_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        search_frame = tk.Frame(search_window)
+        search_frame.pack(fill=tk.X, padx=10, pady=(10, 0))
         
-        if self.history.conversations:
-            for i, conv in enumerate(self.history.conversations[-10:], 1):  # Show last 10
-                timestamp = conv.get("timestamp", "").split("T")[0]
-                history_text.insert(tk.END, 
-                    f"{i}. Session {conv['session_id']} ({timestamp})\n"
-                    f"   Messages: {conv['message_count']}\n"
+        query_field = tk.Entry(search_frame, font=("Arial", self.config.font_size))
+        query_field.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        results_text = scrolledtext.ScrolledText(search_window, wrap=tk.WORD)
+        results_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        results_text.tag_config("timestamp", foreground="gray", font=("Arial", 8))
+        results_text.config(state='disabled')
+        
+        def run_search():
+            query = query_field.get().strip()
+            if not query:
+                return
+            
+            start = time.perf_counter()
+            hits = self.history.search(query, limit=50)
+            elapsed = (time.perf_counter() - start) * 1000
+            
+            results_text.config(state='normal')
+            results_text.delete(1.0, tk.END)
+            results_text.insert(tk.END, f"{len(hits)} results in {elapsed:.1f} ms\n\n", "timestamp")
+            for i, hit in enumerate(hits, 1):
+                results_text.insert(tk.END,
+                    f"{i}. Session {hit['session_id']} #{hit['position']} "
+                    f"({hit['sender'] or 'System'}, score {hit['score']:.2f})\n"
+                    f"   {hit['snippet']}\n"
                     f"   {'-'*40}\n")
-        else:
-            history_text.insert(tk.END, "No chat history available.")
+            if not hits:
+                results_text.insert(tk.END, "No matching messages.")
+            results_text.config(state='disabled')
         
-        history_text.config(state='disabled')
+        query_field.bind("<Return>", lambda e: run_search())
+        tk.Button(search_frame, text="Search", command=run_search,
+                  bg="#2196F3", fg="white").pack(side=tk.LEFT, padx=(5, 0))
+        query_field.focus_set()
     
     def open_settings(self):
         settings_window = Toplevel(self.root)
@@ -1051,16 +4739,52 @@ Context Window: {self.memory.maxlen}
             self.root.after(30000, self.auto_save)
     
     def auto_save(self):
-        if self.config.auto_save and self.current_messages:
-            self.history.save_conversation(self.current_messages, self.session.session_id)
-            self.update_status("Auto-saved conversation")
+        if self.config.auto_save and not self.loading_session:
+            if self.history.sync_conversation(self.current_messages, self.session.session_id):
+                self.update_status("Auto-saved conversation")
         
         # Schedule next auto-save
         if self.config.auto_save:
             self.root.after(30000, self.auto_save)
     
+    def on_first_paint(self):
+        self.root.update_idletasks()
+        STARTUP.record("first paint", time.perf_counter() - STARTUP.origin)
+        if self.config.startup_report:
+            print(STARTUP.report())
+        
+        if self.config.background_warmup:
+            threading.Thread(target=self.warm_up, daemon=True).start()
+    
+    def warm_up(self):
+        # Pay the deferred costs off the Tk thread before the first message
+        self.engine.ensure_loaded()
+        self.history.ensure_loaded()
+        self.history.ensure_search_index()
+        self.ensure_completions()
+        if SENTIMENT_ANALYSIS and load_textblob() is not None:
+            try:
+                TextBlob("warm up").sentiment
+            except Exception:
+                pass
+        if self.config.enable_notifications:
+            load_notifier()
+    
+    def poll_persistence(self):
+        self.writer.drain_completions()
+        self.root.after(100, self.poll_persistence)
+    
+    def on_close(self):
+        # Flush pending history and session writes before the window goes away
+        if self.config.auto_save and not self.loading_session:
+            self.history.sync_conversation(self.current_messages, self.session.session_id)
+        self.writer.close()
+        self.notifier.close(timeout=0)
+        self.root.destroy()
+    
     def send_notification(self, title, message):
-        if self.config.enable_notifications and NOTIFICATIONS:
+        # Runs on the notifier thread
+        if self.config.enable_notifications and NOTIFICATIONS and load_notifier() is not None:
             try:
                 notification.notify(
                     title=title,
@@ -1070,6 +4794,12 @@ Context Window: {self.memory.maxlen}
             except:
                 pass  # Silent fail if notifications not supported
     
+    def window_focused(self):
+        try:
+            return self.root.focus_displayof() is not None
+        except (KeyError, tk.TclError):
+            return False
+    
     def update_status(self, message):
         stats = self.session.get_stats()
         self.status_bar.config(
@@ -1124,8 +4854,16 @@ Tips:
     def run(self):
         self.root.mainloop()
 
+STARTUP.record("import", time.perf_counter() - STARTUP_BEGIN)
+
 # -------------------- Main Execution -------------------- #
 if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "--convert-session":
+        # python chatbot.py --convert-session old.chat [new.chat]
+        destination = convert_pickle_session(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        print(f"Converted session written to {destination}")
+        sys.exit(0)
+    
     print("Starting ChatBuddy Pro...")
     print("Features included:")
     print("✓ Enhanced UI with themes")
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from chatbot import ChatHistory, HistoryJournal, Message, PersistenceWorker, record_to_json
+
+
+def conversation(session_id, *texts):
+    return {"session_id": session_id, "timestamp": "2024-01-01T12:00:00",
+            "message_count": len(texts), "messages": [Message("You", text, "user", 1.0) for text in texts]}
+
+def summary(conversations):
+    return [(conv["session_id"], [msg["message"] for msg in conv["messages"]], conv["message_count"])
+            for conv in conversations]
+
+def test_legacy_import_with_worker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("chat_history.json", 'w') as f:
+        json.dump([conversation("A", "one"), conversation("B", "two")], f, default=record_to_json)
+    
+    writer = PersistenceWorker()
+    history = ChatHistory("journal", writer=writer)
+    assert history.count_sessions() == 2
+    history.save_conversation([Message("You", "three", "user", 3.0)], "C")
+    writer.close()
+    
+    writer = PersistenceWorker()
+    reopened = ChatHistory("journal", writer=writer)
+    assert summary(reopened.conversations) == [("A", ["one"], 1), ("B", ["two"], 1), ("C", ["three"], 1)]
+    reopened.journal.compact()
+    writer.close()
+    assert summary(HistoryJournal(reopened.journal_dir).replay()) == summary(reopened.conversations)
+
+@pytest.mark.parametrize("storage", ["journal", "json"])
+def test_session_keys_survive_retention(tmp_path, monkeypatch, storage):
+    monkeypatch.chdir(tmp_path)
+    history = ChatHistory(storage, retention=2)
+    history.save_conversation([Message("You", "one", "user", 1.0)], "A")
+    history.save_conversation([Message("You", "two", "user", 2.0)], "B")
+    (key, session_id, *_), older = history.session_page(0)
+    assert session_id == "B"
+    
+    # Trimming "A" shifts the retained records; the key still names "B"
+    history.save_conversation([Message("You", "three", "user", 3.0)], "C")
+    history.save_to_file()
+    assert history.count_sessions() == 2
+    assert [entry[1] for entry in history.session_page(0)] == ["C", "B"]
+    assert [msg["message"] for msg in history.load_messages(key)] == ["two"]
+    assert history.load_messages(older[0]) == []
@@ -0,0 +1,20 @@
+from chatbot import ConversationCore, ResponseEngine, SentimentService
+
+
+def test_reply_counts_only_the_user_side():
+    core = ConversationCore(ResponseEngine(SentimentService()))
+    session_id = core.open_session("S")
+    core.reply_batch([(session_id, "hello"), (session_id, "tell me a joke")])
+    
+    memory, session = core.get_session(session_id)
+    assert (session.message_count, session.user_messages, session.bot_messages) == (2, 2, 0)
+    assert len(memory.memory) == 2
+
+def test_record_delivery_counts_the_bot_side():
+    core = ConversationCore(ResponseEngine(SentimentService()))
+    session_id = core.open_session("S")
+    core.reply(session_id, "hello")
+    core.record_delivery(session_id)
+    
+    _, session = core.get_session(session_id)
+    assert (session.message_count, session.user_messages, session.bot_messages) == (2, 1, 1)
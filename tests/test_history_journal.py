@@ -0,0 +1,67 @@
+import time
+
+from chatbot import HistoryJournal, Message
+
+
+def conversation(session_id, *texts):
+    return {"session_id": session_id, "timestamp": "2024-01-01T12:00:00",
+            "message_count": len(texts), "messages": [Message("You", text, "user", 1.0) for text in texts]}
+
+def summary(conversations):
+    return [(conv["session_id"], [msg["message"] for msg in conv["messages"]], conv["message_count"])
+            for conv in conversations]
+
+def test_replay_applies_appends(tmp_path):
+    journal = HistoryJournal(str(tmp_path))
+    first = conversation("A", "one")
+    seq = journal.append_conversation(first)
+    journal.append_conversation(conversation("B", "two"))
+    journal.append_messages(seq, first, [Message("ChatBuddy", "three", "bot", 2.0)])
+    
+    replayed = HistoryJournal(str(tmp_path)).replay()
+    assert summary(replayed) == [("A", ["one", "three"], 2), ("B", ["two"], 1)]
+
+def test_replay_stops_at_torn_tail(tmp_path):
+    journal = HistoryJournal(str(tmp_path))
+    journal.append_conversation(conversation("A", "one"))
+    with open(journal.segment_path(journal.active_id), 'a') as f:
+        f.write('{"op": "append", "seq": 1, "messa')
+    
+    assert summary(HistoryJournal(str(tmp_path)).replay()) == [("A", ["one"], 1)]
+
+def test_retention_keeps_newest(tmp_path):
+    journal = HistoryJournal(str(tmp_path), retention=2)
+    for session_id in "ABC":
+        journal.append_conversation(conversation(session_id, session_id.lower()))
+    
+    assert [conv["session_id"] for conv in journal.live.values()] == ["B", "C"]
+    assert [conv["session_id"] for conv in HistoryJournal(str(tmp_path), retention=2).replay()] == ["B", "C"]
+
+def test_compaction_replaces_segments(tmp_path):
+    journal = HistoryJournal(str(tmp_path), retention=2)
+    for session_id in "ABC":
+        journal.append_conversation(conversation(session_id, session_id.lower()))
+    journal.compact()
+    
+    # One snapshot segment holding only the retained conversations
+    assert len(journal.segment_ids()) == 1
+    journal.append_conversation(conversation("D", "d"))
+    assert summary(HistoryJournal(str(tmp_path), retention=2).replay()) == [("C", ["c"], 1), ("D", ["d"], 1)]
+
+def test_compacts_in_background_when_due(tmp_path):
+    journal = HistoryJournal(str(tmp_path), compact_every=4)
+    for session_id in "ABC":
+        journal.append_conversation(conversation(session_id, session_id.lower()))
+    
+    # Wait for the background snapshot before replaying
+    deadline = time.monotonic() + 5
+    while journal.compacting and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(journal.segment_ids()) <= 2
+    assert [conv["session_id"] for conv in HistoryJournal(str(tmp_path)).replay()] == ["A", "B", "C"]
+
+def test_rewrite(tmp_path):
+    journal = HistoryJournal(str(tmp_path))
+    journal.append_conversation(conversation("A", "one"))
+    journal.rewrite([conversation("B", "two")])
+    assert summary(HistoryJournal(str(tmp_path)).replay()) == [("B", ["two"], 1)]
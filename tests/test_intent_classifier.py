@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from chatbot import IntentClassifier, MessageAnalysis, ResponseEngine, SentimentService
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = ResponseEngine(SentimentService(), classifier="tfidf")
+    engine.ensure_loaded()
+    return engine
+
+def test_classifier_matches_paraphrases(engine):
+    assert engine.classifier.classify("I'm feeling hilarious")[0] == "joke"
+    assert engine.classifier.classify("this is a test")[0] is None
+
+def test_batch_matches_single_messages(engine):
+    texts = ["I'm feeling hilarious", "this is a test", "hello there", "what time is it", ""]
+    analyses = [MessageAnalysis(text) for text in texts]
+    assert engine.classifier.classify_batch(analyses) == [engine.classifier.classify(text) for text in texts]
+
+def test_classifier_rebuilds_after_new_categories():
+    classifier = IntentClassifier({"greeting": {"patterns": ["hello", "hi there"]}})
+    assert classifier.classify("good night")[0] is None
+    classifier.add_category("farewell", ["good night", "see you later"])
+    assert classifier.classify("good night")[0] == "farewell"
+    assert classifier.classify("hello")[0] == "greeting"
+
+def test_classifier_concurrent_adds_and_lookups():
+    classifier = IntentClassifier({"greeting": {"patterns": ["hello", "hi there"]}})
+    errors = []
+    
+    def classify():
+        try:
+            for _ in range(200):
+                assert classifier.classify("hello")[0] == "greeting"
+        except Exception as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=classify) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for i in range(50):
+        classifier.add_category(f"topic{i}", [f"word{i} phrase{i}"])
+    for thread in threads:
+        thread.join()
+    
+    assert not errors
+    assert classifier.classify("word49 phrase49")[0] == "topic49"
@@ -0,0 +1,57 @@
+import threading
+
+from chatbot import IntentMatcher
+
+
+RESPONSES = {
+    "greetings": {"patterns": ["hi", "hello"]},
+    "mood": {"patterns": ["how are you"]},
+    "time": {"patterns": ["time", "what time"]},
+}
+
+def test_matcher_prefers_longest_pattern():
+    matcher = IntentMatcher(RESPONSES)
+    assert matcher.best_match("hi, how are you?") == "mood"
+    assert matcher.best_match("what time is it") == "time"
+    assert matcher.best_match("good day") is None
+
+def test_matcher_breaks_ties_by_priority():
+    matcher = IntentMatcher()
+    matcher.add_category("second", ["same"], priority=2)
+    matcher.add_category("first", ["same"], priority=1)
+    assert matcher.best_match("the same thing") == "first"
+
+def test_matcher_finds_overlapping_patterns():
+    matcher = IntentMatcher({"a": {"patterns": ["he", "she", "hers"]}})
+    assert sorted(matcher.find_all("ushers")) == [(1, "she", "a"), (2, "he", "a"), (2, "hers", "a")]
+
+def test_matcher_rebuilds_after_new_patterns():
+    matcher = IntentMatcher(RESPONSES)
+    assert matcher.best_match("tell me the weather") is None
+    matcher.add_category("weather", ["weather"])
+    assert matcher.best_match("tell me the weather") == "weather"
+
+def test_matcher_concurrent_adds_and_lookups():
+    matcher = IntentMatcher(RESPONSES)
+    errors = []
+    
+    def add():
+        for i in range(300):
+            matcher.add_category(f"topic{i}", [f"word{i}x", f"phrase {i} here"])
+    
+    def find():
+        try:
+            for _ in range(300):
+                assert matcher.best_match("hi, how are you?") == "mood"
+                matcher.find_all("say word12x and phrase 7 here")
+        except Exception as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=add)] + [threading.Thread(target=find) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert not errors
+    assert matcher.best_match("phrase 299 here") == "topic299"
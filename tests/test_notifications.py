@@ -0,0 +1,54 @@
+import chatbot
+from chatbot import NotificationService
+
+
+def service(**kwargs):
+    sent = []
+    notifier = NotificationService(lambda title, message: sent.append((title, message)), **kwargs)
+    return notifier, sent
+
+def test_burst_merges_per_title():
+    notifier, sent = service(merge_window=0.2, rate=10, burst=10)
+    for i in range(3):
+        notifier.notify("ChatBuddy", f"message {i}")
+    notifier.notify("Other", "only one")
+    notifier.close()
+    
+    assert sent == [("ChatBuddy", "3 new messages"), ("Other", "only one")]
+    stats = notifier.get_stats()
+    assert (stats["queued"], stats["merged"], stats["delivered"]) == (4, 2, 2)
+
+def test_token_bucket_drops_over_the_limit(monkeypatch):
+    monkeypatch.setattr(chatbot.time, "monotonic", lambda: 100.0)  # No refill
+    notifier, sent = service(rate=1, burst=2)
+    notifier.deliver([("A", "one"), ("B", "two"), ("C", "three"), ("C", "four")])
+    
+    assert sent == [("A", "one"), ("B", "two")]
+    assert notifier.get_stats()["dropped"] == 2
+    notifier.close()
+
+def test_bucket_refills_over_time(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(chatbot.time, "monotonic", lambda: clock[0])
+    notifier, _ = service(rate=0.5, burst=1)
+    assert notifier.take_token() and not notifier.take_token()
+    clock[0] += 2
+    assert notifier.take_token()
+    notifier.close()
+
+def test_focused_window_suppresses():
+    notifier, sent = service(merge_window=0)
+    notifier.notify("ChatBuddy", "seen already", focused=True)
+    notifier.close()
+    
+    assert sent == []
+    assert (notifier.get_stats()["suppressed"], notifier.get_stats()["queued"]) == (1, 0)
+
+def test_backend_errors_are_counted():
+    def fail(title, message):
+        raise RuntimeError("no backend")
+    
+    notifier = NotificationService(fail, merge_window=0)
+    notifier.notify("ChatBuddy", "hello")
+    notifier.close()
+    assert notifier.get_stats()["errors"] == 1
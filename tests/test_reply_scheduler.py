@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from chatbot import ReplyScheduler
+
+
+def test_replies_are_delivered_in_order():
+    scheduler = ReplyScheduler(delay=0, jitter=0)
+    delivered = []
+    scheduler.schedule(delivered.append, "first", delay=0.5)
+    scheduler.schedule(delivered.append, "second", delay=0.1)  # Never overtakes "first"
+    scheduler.schedule(delivered.append, "third", delay=0.3)
+    
+    assert scheduler.pop_due(time.monotonic()) == []
+    for callback, args in scheduler.pop_due(time.monotonic() + 1):
+        callback(*args)
+    assert delivered == ["first", "second", "third"]
+    assert scheduler.time_until_next() is None
+
+def test_cancel_skips_one_reply():
+    scheduler = ReplyScheduler(delay=0, jitter=0)
+    handle = scheduler.schedule(print, "dropped")
+    scheduler.schedule(print, "kept")
+    scheduler.cancel(handle)
+    
+    assert scheduler.pending() == 1
+    assert [args for _, args in scheduler.pop_due(time.monotonic() + 1)] == [("kept",)]
+
+def test_cancel_all_drops_everything():
+    scheduler = ReplyScheduler(delay=10, jitter=0)
+    for i in range(3):
+        scheduler.schedule(print, i)
+    
+    assert scheduler.cancel_all() == 3
+    assert scheduler.pending() == 0
+    assert scheduler.pop_due(time.monotonic() + 60) == []
+
+def test_serve_runs_callbacks_on_the_loop():
+    scheduler = ReplyScheduler(delay=0.01, jitter=0)
+    delivered = []
+    
+    async def main():
+        done = asyncio.Event()
+        server = asyncio.ensure_future(scheduler.serve())
+        await asyncio.sleep(0)
+        for i in range(3):
+            scheduler.schedule(delivered.append, i)
+        scheduler.schedule(done.set)
+        await asyncio.wait_for(done.wait(), 5)
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
+    
+    asyncio.run(main())
+    assert delivered == [0, 1, 2]
+    assert scheduler.loop is None
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from chatbot import ChatHistory, Message, SearchIndex, SQLiteChatHistory
+
+
+def open_history(tmp_path, storage, retention=50):
+    if storage == "sqlite":
+        history = SQLiteChatHistory(str(tmp_path / "history.db"), retention=retention)
+    else:
+        history = ChatHistory(storage, retention)
+    history.search_index = SearchIndex(str(tmp_path / "chat_history.index"))
+    return history
+
+def texts(hits):
+    return [(hit["session_id"], hit["snippet"]) for hit in hits]
+
+@pytest.fixture(params=["journal", "json", "sqlite"])
+def storage(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return request.param
+
+def test_new_record_after_clear_is_indexed(tmp_path, storage):
+    history = open_history(tmp_path, storage)
+    history.sync_conversation([Message("You", "apples", "user")], "S")
+    history.end_conversation("S")
+    history.sync_conversation([Message("You", "bananas", "user")], "S")
+    
+    assert texts(history.search("bananas")) == [("S", "bananas")]
+    assert texts(history.search("apples")) == [("S", "apples")]
+
+def test_evicted_conversations_leave_the_index(tmp_path, storage):
+    history = open_history(tmp_path, storage, retention=2)
+    for session_id, word in (("A", "apples"), ("B", "bananas"), ("C", "cherries")):
+        history.sync_conversation([Message("You", word, "user")], session_id)
+    
+    assert history.search("apples") == []
+    assert texts(history.search("cherries")) == [("C", "cherries")]
+    
+    # A reloaded index drops logged documents of evicted conversations
+    reopened = open_history(tmp_path, storage, retention=2)
+    assert reopened.search("apples") == []
+    assert texts(reopened.search("bananas")) == [("B", "bananas")]
+
+def test_compaction_rewrites_the_log(tmp_path):
+    index = SearchIndex(str(tmp_path / "index"))
+    index.COMPACT_MIN = 2
+    index.load(set, list)
+    for record in range(4):
+        index.add_messages(record, f"S{record}", [Message("You", f"word{record} shared", "user")])
+    
+    index.remove([0, 1])
+    assert index.removed == 0 and len(index.docs) == 2
+    with open(tmp_path / "index") as f:
+        assert [json.loads(line)["r"] for line in f] == [2, 3]
+    assert sorted(hit["session_id"] for hit in index.search("shared")) == ["S2", "S3"]
+    assert index.search("word0") == []
+
+def test_pre_record_index_file_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    history = open_history(tmp_path, "journal")
+    history.search_index = None
+    history.sync_conversation([Message("You", "apples", "user")], "S")
+    with open(tmp_path / "chat_history.index", 'w') as f:
+        f.write(json.dumps({"s": "S", "p": 0, "f": "You", "t": None, "m": "stale"}) + "\n")
+    
+    reopened = open_history(tmp_path, "journal")
+    assert reopened.search("stale") == []
+    assert texts(reopened.search("apples")) == [("S", "apples")]
+
+def test_index_keeps_no_message_text(tmp_path, storage):
+    history = open_history(tmp_path, storage)
+    history.sync_conversation([Message("You", "apples and pears", "user")], "S")
+    
+    assert history.search_index.docs == [(history.search_index.docs[0][0], 0)]
+    with open(tmp_path / "chat_history.index") as f:
+        entry = json.loads(f.readline())
+    assert entry["w"] == {"apples": 1, "and": 1, "pears": 1} and "m" not in entry
+    
+    hit, = history.search("pears")
+    assert (hit["sender"], hit["snippet"]) == ("You", "apples and pears")
+
+def test_reload_reads_only_live_keys(tmp_path, storage, monkeypatch):
+    history = open_history(tmp_path, storage)
+    history.sync_conversation([Message("You", "apples", "user")], "S")
+    
+    # With an index file on disk, no conversation is loaded to decide liveness
+    reopened = open_history(tmp_path, storage)
+    monkeypatch.setattr(reopened, "records", lambda: pytest.fail("conversations loaded"))
+    reopened.ensure_search_index()
+    assert len(reopened.search_index.docs) == 1
@@ -0,0 +1,58 @@
+from chatbot import ChatHistory, HistoryJournal, Message, SessionBuffer, SessionSlice
+
+
+def fill(buffer, start, stop):
+    for i in range(start, stop):
+        buffer.append(Message("You", f"message {i}", "user", float(i)))
+
+def texts(messages):
+    return [msg["message"] for msg in messages]
+
+def test_buffer_spills_and_reads_back():
+    buffer = SessionBuffer(hot_limit=10)
+    fill(buffer, 0, 100)
+    
+    stats = buffer.get_stats()
+    assert stats["messages"] == 100 and stats["in_memory"] <= 10
+    assert buffer[0]["message"] == "message 0"
+    assert texts(buffer[45:48]) == ["message 45", "message 46", "message 47"]
+    assert texts(reversed(buffer))[:2] == ["message 99", "message 98"]
+
+def test_view_is_fixed_and_survives_clear():
+    buffer = SessionBuffer(hot_limit=10)
+    fill(buffer, 0, 50)
+    view = buffer.view()
+    fill(buffer, 50, 60)
+    
+    assert len(view) == 50
+    assert view[-1]["message"] == "message 49"
+    assert isinstance(view[10:20], SessionSlice)
+    assert texts(view[10:12]) == ["message 10", "message 11"]
+    
+    buffer.clear()
+    fill(buffer, 0, 5)
+    assert texts(view) == [f"message {i}" for i in range(50)]
+    assert not view.hot  # Retired to the spill file by clear()
+
+def test_history_record_reads_through_the_buffer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    history = ChatHistory("journal")
+    buffer = SessionBuffer(hot_limit=10)
+    fill(buffer, 0, 40)
+    history.sync_conversation(buffer, "S")
+    fill(buffer, 40, 80)
+    history.sync_conversation(buffer, "S")
+    
+    record = history.get_conversation("S")
+    assert isinstance(record["messages"], SessionSlice)
+    assert record["message_count"] == 80
+    
+    history.end_conversation("S")
+    buffer.clear()
+    (key, *_), = history.session_page(0)
+    assert texts(history.load_messages(key)) == [f"message {i}" for i in range(80)]
+    
+    # Compaction streams the view; the journal replays the same transcript
+    history.journal.compact()
+    replayed = HistoryJournal(history.journal_dir).replay()
+    assert texts(replayed[0]["messages"]) == [f"message {i}" for i in range(80)]
@@ -0,0 +1,105 @@
+import io
+import pickle
+
+import pytest
+
+from chatbot import (Exchange, Message, SentimentTracker, SessionReader, convert_pickle_session,
+                     encode_session, iter_session, read_session)
+
+
+def sample_session(count=5):
+    return {
+        "session": {"session_id": "20240101_120000", "message_count": count},
+        "config": {"theme": "Dark"},
+        "topics": {"counts": {"weather": 2}},
+        "sentiment": {"count": 3, "mean": 0.2, "m2": 0.1, "ema": 0.25, "trend": [0.1, 0.25]},
+        "memory": [Exchange("hello", "hi there", 1700000000.0)],
+        "messages": [
+            {"sender": "You" if i % 2 == 0 else "ChatBuddy", "message": f"message {i}",
+             "type": "user" if i % 2 == 0 else "bot", "timestamp": "2024-01-01T12:00:00.250000"}
+            for i in range(count)
+        ] + [{"sender": "System", "type": "attachment", "filename": "notes.txt", "timestamp": "soon"}]
+    }
+
+def decode(data):
+    return list(SessionReader(io.BytesIO(data)))
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip(compress):
+    session_data = sample_session()
+    records = decode(encode_session(session_data, compress))
+    
+    kind, meta = records[0]
+    assert kind == "meta"
+    assert meta == {"session": session_data["session"], "config": {"theme": "Dark"},
+                    "topics": {"counts": {"weather": 2}}, "sentiment": session_data["sentiment"]}
+    
+    kind, exchange = records[1]
+    assert kind == "memory"
+    assert (exchange.user, exchange.bot, exchange.timestamp) == ("hello", "hi there", 1700000000.0)
+    
+    messages = [value for kind, value in records[2:]]
+    assert all(kind == "message" for kind, value in records[2:])
+    assert messages == session_data["messages"]
+    assert messages[-1]["filename"] == "notes.txt"
+
+def test_streams_in_batches_without_materializing_messages():
+    messages = (Message("You", f"message {i}", "user", float(i)) for i in range(2500))
+    chunks = list(iter_session({"messages": messages}, compress=False, batch=1000))
+    
+    # Header, two full batches, then the tail with the end marker
+    assert len(chunks) == 4
+    records = decode(b"".join(chunks))
+    assert [value.message for kind, value in records if kind == "message"][-1] == "message 2499"
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_truncated_file_raises(compress):
+    data = encode_session(sample_session(50), compress)
+    for end in (len(data) // 2, len(data) - 1):
+        with pytest.raises(ValueError):
+            decode(data[:end])
+
+def test_rejects_other_files():
+    with pytest.raises(ValueError):
+        SessionReader(io.BytesIO(b"not a session"))
+    assert not SessionReader.is_session_file(io.BytesIO(b"\x80\x04pickle"))
+
+def test_convert_pickle_session(tmp_path):
+    path = tmp_path / "old.chat"
+    session_data = sample_session()
+    with open(path, 'wb') as f:
+        pickle.dump(session_data, f)
+    
+    assert convert_pickle_session(str(path)) == str(path)
+    assert (tmp_path / "old.chat.pickle.bak").exists()
+    with open(path, 'rb') as f:
+        assert SessionReader.is_session_file(f)
+    
+    converted = read_session(str(path))
+    assert converted["messages"] == session_data["messages"]
+    assert converted["session"] == session_data["session"]
+    assert [exchange.user for exchange in converted["memory"]] == ["hello"]
+
+def test_sentiment_state_round_trips():
+    tracker = SentimentTracker()
+    for score in (0.5, -0.2, 0.9):
+        tracker.update(score)
+    records = decode(encode_session({"sentiment": tracker.get_state()}))
+    
+    restored = SentimentTracker()
+    restored.set_state(records[0][1]["sentiment"])
+    assert restored.get_stats() == tracker.get_stats()
+
+def test_sessions_without_sentiment_state():
+    # Files from before the state was stored; the loader recomputes it
+    meta = decode(encode_session({"messages": []}))[0][1]
+    assert meta["sentiment"] is None
+
+def test_convert_pickle_session_to_new_file(tmp_path):
+    source = tmp_path / "old.chat"
+    with open(source, 'wb') as f:
+        pickle.dump(sample_session(), f)
+    
+    destination = convert_pickle_session(str(source), str(tmp_path / "new.chat"))
+    assert read_session(destination)["messages"] == sample_session()["messages"]
+    assert not (tmp_path / "old.chat.pickle.bak").exists()
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import chatbot
+from chatbot import ConversationMemory, SessionManager, SessionRegistry
+
+
+def new_session(session_id):
+    session = SessionManager()
+    session.session_id = session_id
+    return ConversationMemory(), session
+
+def test_capacity_evicts_least_recently_used():
+    registry = SessionRegistry(new_session, capacity=2, shards=1)
+    a = registry.get("A")
+    registry.get("B")
+    assert registry.get("A") is a  # "B" is now the least recently used
+    registry.get("C")
+    
+    assert "A" in registry and "C" in registry and "B" not in registry
+    assert registry.get_stats()["evicted"] == 1
+
+def test_sweep_expires_idle_sessions(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(chatbot.time, "monotonic", lambda: clock[0])
+    registry = SessionRegistry(new_session, ttl=10, shards=4)
+    registry.get("A")
+    clock[0] += 5
+    registry.get("B")
+    
+    clock[0] += 6
+    assert registry.sweep() == 1
+    assert "A" not in registry and "B" in registry
+    assert registry.get_stats()["expired"] == 1
+
+def test_evicted_session_restores_from_snapshot(tmp_path):
+    registry = SessionRegistry(new_session, capacity=1, shards=1, snapshot_dir=str(tmp_path))
+    memory, session = registry.get("A")
+    memory.add_exchange("hello", "hi there")
+    session.message_count = 2
+    registry.get("B")
+    assert "A" not in registry
+    
+    memory, session = registry.get("A")
+    assert [exchange.user for exchange in memory.memory] == ["hello"]
+    assert session.message_count == 2
+    stats = registry.get_stats()
+    assert (stats["snapshots"], stats["restored"]) == (2, 1)  # "B" was snapshotted in turn
+    assert registry.get("Z", create=False) is None
+
+def test_pinned_sessions_survive_eviction():
+    registry = SessionRegistry(new_session, capacity=1, shards=1)
+    pinned = registry.put("W", new_session("W"), pinned=True)
+    for session_id in "ABC":
+        registry.get(session_id)
+    
+    assert registry.get("W") is pinned
+    assert registry.sweep() == 0 and len(registry) == 2
+
+def test_concurrent_misses_share_the_restored_session(tmp_path):
+    built = []
+    
+    def slow_factory(session_id):
+        time.sleep(0.01)
+        built.append(session_id)
+        return new_session(session_id)
+    
+    registry = SessionRegistry(slow_factory, capacity=1, shards=1, snapshot_dir=str(tmp_path))
+    memory, _ = registry.get("A")
+    memory.add_exchange("hello", "hi there")
+    registry.get("B")
+    built.clear()
+    
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("A"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert all(state is results[0] for state in results)
+    assert [exchange.user for exchange in results[0][0].memory] == ["hello"]
+    assert built == ["A"]  # Only the snapshot restore built a session
@@ -0,0 +1,47 @@
+import pytest
+
+from chatbot import MessageAnalysis, ResponseEngine, SentimentService, SpellCorrector
+
+
+def test_corrector_fixes_typos():
+    corrector = SpellCorrector(["hello there", "what time is it", "tell me a joke"])
+    assert corrector.correct("helo") == "hello"
+    assert corrector.correct("waht tiem is it") == "what time is it"
+    assert corrector.correct("jokee") == "joke"
+
+def test_corrector_fixes_three_letter_typos():
+    corrector = SpellCorrector(["tell me the joke"])
+    assert corrector.correct("jok") == "joke"
+    assert corrector.correct("teh") == "the"
+
+def test_corrector_leaves_known_and_short_words():
+    corrector = SpellCorrector(["hello there"])
+    assert corrector.correct("hello ok") == "hello ok"
+    assert corrector.lookup("hel") == "hel"
+
+@pytest.mark.parametrize("word, vocabulary", [
+    ("dime", "what time is it"),   # A substitution of a short word
+    ("sad", "you are mad"),        # The same at three letters
+    ("him", "hi there"),           # A dropped letter at three letters
+])
+def test_corrector_skips_risky_short_edits(word, vocabulary):
+    corrector = SpellCorrector([vocabulary])
+    assert corrector.correct(word) == word
+
+def test_corrector_returns_same_analysis_when_unchanged():
+    corrector = SpellCorrector(["hello there"])
+    analysis = MessageAnalysis("hello there")
+    assert corrector.correct_analysis(analysis) is analysis
+    assert corrector.correct_analysis(MessageAnalysis("helo there")).normalized == "hello there"
+
+def test_corrector_learns_known_words():
+    corrector = SpellCorrector(["thanks", "tell me a joke"])
+    assert corrector.correct("thnaks jok") == "thanks joke"
+    corrector.add_known(["thnaks", "jok"])
+    assert corrector.correct("thnaks jok") == "thnaks jok"
+
+def test_engine_vocabulary_corrects_intents():
+    engine = ResponseEngine(SentimentService())
+    assert engine.corrector.correct("tell me a jokke") == "tell me a joke"
+    assert engine.match_category("tell me a jok") == "joke"
+    assert engine.match_category("waht tiem is it") == engine.match_category("what time is it")
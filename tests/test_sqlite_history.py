@@ -0,0 +1,62 @@
+import pytest
+
+from chatbot import Message, SQLiteChatHistory
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    history = SQLiteChatHistory(str(tmp_path / "history.db"), retention=50, max_age_days=1)
+    history.search_index = None
+    yield history
+    history.connection.close()
+
+def age(history, session_id):
+    with history.connection:
+        history.connection.execute("UPDATE sessions SET timestamp = '2000-01-01T00:00:00' WHERE session_id = ?",
+                                   (session_id,))
+
+def orphans(history):
+    return history.connection.execute(
+        "SELECT COUNT(*) FROM messages WHERE conversation_id NOT IN (SELECT id FROM sessions)").fetchone()[0]
+
+def test_sync_after_age_eviction_starts_new_conversation(history):
+    messages = [Message.now("You", "one", "user")]
+    history.sync_conversation(messages, "S")
+    age(history, "S")
+    
+    # The next flush drops the aged session, including this delta
+    messages.append(Message.now("ChatBuddy", "two", "bot"))
+    history.sync_conversation(messages, "S")
+    assert history.get_conversation("S") is None
+    
+    messages.append(Message.now("You", "three", "user"))
+    history.sync_conversation(messages, "S")
+    assert [msg["message"] for msg in history.get_conversation("S")["messages"]] == ["one", "two", "three"]
+    assert orphans(history) == 0
+
+def test_delta_for_deleted_session_is_not_written(history):
+    messages = [Message.now("You", "one", "user")]
+    history.sync_conversation(messages, "S")
+    age(history, "S")
+    history.sync_conversation([Message.now("You", "other", "user")], "T")
+    
+    # A delta racing the eviction still targets the deleted row id
+    history.evicted.clear()
+    messages.append(Message.now("ChatBuddy", "two", "bot"))
+    history.sync_conversation(messages, "S")
+    assert orphans(history) == 0
+
+def test_orphans_removed_on_load(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    history = SQLiteChatHistory(str(tmp_path / "history.db"))
+    history.search_index = None
+    history.sync_conversation([Message.now("You", "one", "user")], "S")
+    with history.connection:
+        history.connection.execute("DELETE FROM sessions")
+    history.connection.close()
+    
+    reopened = SQLiteChatHistory(str(tmp_path / "history.db"))
+    reopened.ensure_loaded()
+    assert orphans(reopened) == 0
+    reopened.connection.close()
@@ -0,0 +1,61 @@
+from collections import deque
+import tkinter as tk
+
+import pytest
+
+from chatbot import ChatBuddyPro, Config
+
+
+@pytest.fixture
+def app():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("no display available")
+    root.geometry("300x200")
+    chat_area = tk.Text(root, height=5)
+    chat_area.pack(fill=tk.BOTH, expand=True)
+    root.update_idletasks()
+    
+    # Only the state add_message/trim_transcript touch; no menus or history
+    app = ChatBuddyPro.__new__(ChatBuddyPro)
+    app.root = root
+    app.chat_area = chat_area
+    app.config = Config()
+    app.config.render_window = 5
+    app.current_messages = []
+    app.rendered = deque()
+    app.typing = False
+    app.batch_rendering = False
+    app.batch_at_bottom = True
+    app.pending_status = None
+    app.update_status = lambda message: None
+    yield app
+    root.destroy()
+
+def add(app, count):
+    for i in range(count):
+        app.add_message("Bot", f"message {i}", "bot")
+        app.root.update_idletasks()
+
+def test_trims_while_following_the_end(app):
+    add(app, 20)
+    assert len(app.rendered) == 5
+    assert app.chat_area.get("1.0", "1.end").endswith("Bot: message 15")
+
+def test_waits_while_scrolled_up(app):
+    add(app, 10)
+    app.chat_area.yview_moveto(0.0)
+    app.root.update_idletasks()
+    app.add_message("Bot", "late", "bot")
+    assert len(app.rendered) == 6
+    
+    # The insert scrolled back to the end, so the next message trims
+    app.root.update_idletasks()
+    app.add_message("Bot", "later", "bot")
+    assert len(app.rendered) == 5
+
+def test_batch_trims_when_frame_started_at_the_end(app):
+    add(app, 5)
+    app.render_frame([(app.add_message, ("Bot", f"batch {i}", "bot")) for i in range(10)])
+    assert len(app.rendered) == 5